@@ -0,0 +1,83 @@
+# Бенчмарк выборки данных карты: фильтрация всей таблицы + merge
+# против поиска в индексе по датам (src/map_index.py).
+#
+# Запуск из корня репозитория:
+#     python benchmarks/bench_map_index.py --countries 200 --days 1000
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from map_index import build_date_index, build_map_countries, lookup_date  # noqa: E402
+from schema import compact_coords, compact_daily_stats  # noqa: E402
+
+
+# Синтетические данные в схеме daily_statistics и countries_coord
+def make_synthetic(n_countries, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    names = [f'Country {i}' for i in range(n_countries)]
+    dates = pd.date_range('2020-01-22', periods=n_days)
+    daily = pd.DataFrame({
+        'name': np.repeat(names, n_days),
+        'observed_date': np.tile(dates, n_countries),
+        'confirmed_per_100k': rng.gamma(2.0, 10.0, n_countries * n_days),
+        'deaths_per_100k': rng.gamma(2.0, 0.5, n_countries * n_days),
+    })
+    coord = pd.DataFrame({
+        'name': names,
+        'longitude': rng.uniform(-180, 180, n_countries),
+        'latitude': rng.uniform(-60, 70, n_countries),
+    })
+    return daily, coord, dates
+
+
+# Прежний путь из update_world_map
+def scan_and_merge(daily, coord, date):
+    date_data = daily[daily['observed_date'] == date].copy()
+    map_data = pd.merge(date_data, coord, on='name', how='left')
+    return map_data.dropna(subset=['longitude', 'latitude'])
+
+
+def time_per_call(func, dates, repeats):
+    timings = []
+    for _ in range(repeats):
+        for date in dates:
+            start = time.perf_counter()
+            func(date)
+            timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--countries', type=int, default=200)
+    parser.add_argument('--days', type=int, default=1000)
+    parser.add_argument('--samples', type=int, default=50)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    daily, coord, dates = make_synthetic(args.countries, args.days)
+    colors = {name: '#1f77b4' for name in coord['name']}
+    sample_dates = pd.DatetimeIndex(np.random.default_rng(1).choice(dates, args.samples))
+
+    start = time.perf_counter()
+    date_index = build_date_index(compact_daily_stats(daily), build_map_countries(compact_coords(coord), colors))
+    build_ms = (time.perf_counter() - start) * 1000
+
+    old = time_per_call(lambda d: scan_and_merge(daily, coord, d), sample_dates, args.repeats)
+    new = time_per_call(lambda d: lookup_date(date_index, d), sample_dates, args.repeats)
+
+    print(f'Строк: {len(daily)}, дат: {len(date_index)}, построение индекса: {build_ms:.1f} мс')
+    for label, timings in (('фильтр + merge', old), ('индекс по датам', new)):
+        print(f'{label:>16}: медиана {np.median(timings):.3f} мс, '
+              f'p95 {np.percentile(timings, 95):.3f} мс')
+    print(f'Ускорение по медиане: {np.median(old) / np.median(new):.0f}x')
+
+
+if __name__ == '__main__':
+    main()
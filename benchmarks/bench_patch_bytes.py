@@ -0,0 +1,65 @@
+# Размер ответа сервера на одно действие пользователя: полная фигура
+# против частичного обновления (dash.Patch) для карты и шести графиков страны.
+#
+# Запуск из корня репозитория:
+#     python benchmarks/bench_patch_bytes.py --countries 200 --days 365
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from standin import build_standin, dash_request, import_app  # noqa: E402
+
+MAP_OUTPUTS = [('world-map', 'figure'), ('map-legend-table', 'data'), ('map-legend-message', 'children'),
+               ('map-figure-kind', 'data')]
+
+
+def map_request(client, date, figure_kind):
+    inputs = [('date-picker', 'date', date), ('map-mode', 'value', 'date'),
+              ('timelapse-stride', 'value', 7), ('timelapse-max-frames', 'value', 60)]
+    response, nbytes = dash_request(client, MAP_OUTPUTS, inputs,
+                                    state=[('map-figure-kind', 'data', figure_kind)],
+                                    changed=[('date-picker', 'date')])
+    figure_bytes = len(json.dumps(response['response']['world-map']['figure']).encode())
+    return nbytes, figure_bytes
+
+
+def graphs_request(client, app_module, country, filled):
+    outputs = [(graph_id, 'figure') for graph_id in app_module.GRAPH_IDS]
+    outputs += [('graphs-message', 'children'), ('graphs-container', 'style'), ('graphs-filled', 'data')]
+    _, nbytes = dash_request(client, outputs, [('country-dropdown', 'value', country)],
+                             state=[('graphs-filled', 'data', filled)],
+                             changed=[('country-dropdown', 'value')])
+    return nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--countries', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = import_app(build_standin(workdir, args.countries, args.days))
+        client = app_module.server.test_client()
+        dates = list(app_module.data_snapshot.date_index)
+        date = dates[len(dates) // 2].strftime('%Y-%m-%d')
+        countries = app_module.data_snapshot.country_store.names()
+
+        map_full, map_figure_full = map_request(client, date, None)
+        map_patch, map_figure_patch = map_request(client, date, 'date')
+        graphs_full = graphs_request(client, app_module, countries[1], False)
+        graphs_patch = graphs_request(client, app_module, countries[1], True)
+
+    print(f'Стран: {args.countries}, дней: {args.days}')
+    print(f'{"":>22}{"полная фигура":>16}{"Patch":>12}')
+    print(f'{"карта (с легендой)":>22}{map_full:>16,}{map_patch:>12,}')
+    print(f'{"только фигура карты":>22}{map_figure_full:>16,}{map_figure_patch:>12,}')
+    print(f'{"шесть графиков":>22}{graphs_full:>16,}{graphs_patch:>12,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+# Набор замеров приложения на синтетических данных разного объема:
+# загрузка модуля (с разбором Excel и из кэша на диске) и каждый колбэк,
+# вызванный напрямую. Для каждого масштаба - перцентили задержки, пиковая
+# память процесса и размер сериализованного ответа. Результат пишется в JSON
+# и сравнивается с сохраненным базовым отчетом.
+#
+# Запуск из корня репозитория:
+#     python benchmarks/bench_suite.py --scales 1x,10x --output bench_report.json \
+#         --baseline benchmarks/baseline.json
+#
+# Каждый масштаб замеряется в отдельном процессе: так загрузка модуля
+# честно «холодная», а пиковая память не смешивается между масштабами.
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from standin import EXCEL_MAX_ROWS, build_standin, import_app  # noqa: E402
+
+# Текущий объем данных (1x): страны из countries_coord.xlsx и около 1000 дней
+# наблюдений. Масштаб делится поровну между числом стран и числом дней
+BASE_COUNTRIES = 197
+BASE_DAYS = 1000
+SCALES = {'1x': 1, '10x': 10, '100x': 100}
+
+# Перцентили задержки в отчете
+PERCENTILES = (50, 90, 95, 99)
+
+# Метрики, которые сравниваются с базовым отчетом (чем меньше, тем лучше)
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'response_bytes')
+
+
+def scale_shape(scale):
+    factor = np.sqrt(SCALES[scale])
+    return int(round(BASE_COUNTRIES * factor)), int(round(BASE_DAYS * factor))
+
+
+def peak_rss_mb():
+    # ru_maxrss в Linux - килобайты, в macOS - байты
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+
+def summarize(timings_ms, sizes):
+    timings = np.asarray(timings_ms)
+    summary = {f'p{p}_ms': round(float(np.percentile(timings, p)), 3) for p in PERCENTILES}
+    summary.update(
+        mean_ms=round(float(timings.mean()), 3),
+        min_ms=round(float(timings.min()), 3),
+        max_ms=round(float(timings.max()), 3),
+        samples=len(timings),
+        response_bytes=int(np.median(sizes)),
+    )
+    return summary
+
+
+# Все кэши ответов и фигур приложения: без их очистки повторные вызовы
+# замеряли бы попадания в кэш, а не работу колбэка
+def clear_caches(app_module):
+    app_module.callback_cache.clear()
+    app_module.figure_cache.clear()
+    app_module.country_details.clear()
+    app_module.get_timelapse_figure.cache_clear()
+    app_module.get_client_payload.cache_clear()
+
+
+# Вызовы колбэков: имя -> список вызовов без аргументов, по одному на выборку
+def callback_cases(app_module, samples, seed=1):
+    rng = np.random.default_rng(seed)
+    dates = list(app_module.data_snapshot.date_index)
+    countries = app_module.data_snapshot.country_store.names()
+    sample_dates = [dates[i].strftime('%Y-%m-%d') for i in rng.choice(len(dates), samples)]
+    sample_countries = [countries[i] for i in rng.choice(len(countries), samples)]
+    first, last = dates[0].strftime('%Y-%m-%d'), dates[-1].strftime('%Y-%m-%d')
+    middle = dates[len(dates) // 2].strftime('%Y-%m-%d')
+
+    return {
+        'render_content[map]': [lambda: app_module.render_content('tab-map')] * samples,
+        'render_content[country]': [lambda: app_module.render_content('tab-country')] * samples,
+        'update_world_map': [lambda d=d: app_module.update_world_map(d) for d in sample_dates],
+        'update_world_map[patch]': [lambda d=d: app_module.render_world_map(d, 'date', None, None, True)
+                                    for d in sample_dates],
+        'update_world_map[timelapse]': [lambda: app_module.update_world_map(None, 'timelapse', 7, 60)] * samples,
+        'update_range_map[sum]': [lambda: app_module.update_range_map('range', first, last, 'sum')] * samples,
+        'update_range_map[max]': [lambda: app_module.update_range_map('range', first, middle, 'max')] * samples,
+        'load_map_payload': [lambda: app_module.load_map_payload('client', None)] * samples,
+        'update_tables': [lambda c=c: app_module.update_tables(c) for c in sample_countries],
+        'update_graphs': [lambda c=c: app_module.update_graphs(c, False) for c in sample_countries],
+        'update_graphs[patch]': [lambda c=c: app_module.update_graphs(c, True) for c in sample_countries],
+        'zoom_confirmed': [lambda c=c: app_module.zoom_confirmed({'xaxis.range[0]': first, 'xaxis.range[1]': middle}, c)
+                           for c in sample_countries],
+        'update_comparison[10]': [lambda i=i: app_module.update_comparison(countries[i:i + 10])
+                                  for i in rng.choice(max(len(countries) - 10, 1), samples)],
+    }
+
+
+# Память наборов данных, МБ: кадры в том виде, в каком они читаются из
+# источников (до перевода в компактные типы), компактные наборы
+# load_datasets с производными показателями и все наборы после
+# prepare_datasets - вместе с таблицей карты и массивами RangeIndex
+def dataset_memory(app_module):
+    import pandas as pd
+    from data_loader import load_datasets, load_risks, prepare_datasets, read_excel_cached
+    from schema import memory_report
+
+    materials_dir = os.environ['COVID_MATERIALS_DIR']
+    source = {
+        'df_countries': pd.read_sql_query('SELECT * FROM geo_info.countries', app_module.engine),
+        'risk_df': load_risks(os.path.join(materials_dir, 'risks.csv')),
+        'daily_stats_df': read_excel_cached(os.path.join(materials_dir, 'daily_statistics.xlsx')),
+        'coord_df': read_excel_cached(os.path.join(materials_dir, 'countries_coord.xlsx')),
+    }
+    compact = load_datasets(app_module.engine, materials_dir)
+    prepared = prepare_datasets(compact)
+
+    memory = {}
+    for label, frames in (('source', source), ('compact', compact), ('prepared', prepared)):
+        report = {name: round(nbytes / 2 ** 20, 2) for name, nbytes in memory_report(frames).items()}
+        memory[label] = dict(report, total=round(sum(report.values()), 2))
+    return memory
+
+
+def time_calls(calls, app_module, cached):
+    from plotly.io.json import to_json_plotly
+
+    timings, sizes = [], []
+    for call in calls:
+        if not cached:
+            clear_caches(app_module)
+        else:
+            call()
+        start = time.perf_counter()
+        result = call()
+        timings.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(to_json_plotly(result)))
+    return summarize(timings, sizes)
+
+
+# Замеры одного масштаба (выполняется в отдельном процессе)
+def run_scale(scale, samples, workdir):
+    n_countries, n_days = scale_shape(scale)
+    started_at = time.perf_counter()
+    env = build_standin(workdir, n_countries, n_days)
+    standin_s = time.perf_counter() - started_at
+    excel = n_countries * n_days <= EXCEL_MAX_ROWS
+
+    # Загрузка модуля: синхронная загрузка данных при импорте
+    started_at = time.perf_counter()
+    app_module = import_app(env)
+    import_s = time.perf_counter() - started_at
+    import_rss = peak_rss_mb()
+
+    # Повторная загрузка: подготовленные наборы уже в кэше на диске
+    started_at = time.perf_counter()
+    app_module.load_data()
+    reload_s = time.perf_counter() - started_at
+
+    # Повторная загрузка без кэша подготовленных наборов: Excel читается из
+    # колоночного кэша, производные показатели и индексы считаются заново
+    import data_loader
+    for path in data_loader._prepared_cache_paths(data_loader.CACHE_DIR):
+        os.remove(path)
+    started_at = time.perf_counter()
+    app_module.load_data()
+    reload_unprepared_s = time.perf_counter() - started_at
+    memory = dataset_memory(app_module)
+
+    callbacks, callbacks_cached = {}, {}
+    for name, calls in callback_cases(app_module, samples).items():
+        callbacks[name] = time_calls(calls, app_module, cached=False)
+    for name in ('update_world_map', 'update_tables', 'update_graphs'):
+        callbacks_cached[name] = time_calls(callback_cases(app_module, samples)[name], app_module, cached=True)
+
+    return {
+        'countries': n_countries,
+        'days': n_days,
+        'rows': n_countries * n_days,
+        'standin_seconds': round(standin_s, 2),
+        'load': {
+            'import_seconds': round(import_s, 3),
+            'import_parses_excel': excel,
+            'reload_from_cache_seconds': round(reload_s, 3),
+            'reload_without_prepared_cache_seconds': round(reload_unprepared_s, 3),
+            'peak_rss_after_load_mb': import_rss,
+        },
+        'peak_rss_mb': peak_rss_mb(),
+        'dataset_memory_mb': memory,
+        'callbacks': callbacks,
+        'callbacks_cached': callbacks_cached,
+    }
+
+
+def environment_info():
+    import dash
+    import pandas as pd
+    import plotly
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'dash': dash.__version__,
+        'plotly': plotly.__version__,
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+    }
+
+
+# Сравнение с базовым отчетом: отношение «сейчас / база» для задержек,
+# размеров ответов, загрузки и памяти; рост больше tolerance - регрессия
+def compare(report, baseline, tolerance):
+    rows = []
+
+    def add(scale, metric, old, new):
+        if not old or new is None:
+            return
+        ratio = new / old
+        status = 'хуже' if ratio > 1 + tolerance else 'лучше' if ratio < 1 - tolerance else 'так же'
+        rows.append({'scale': scale, 'metric': metric, 'baseline': old, 'current': new,
+                     'ratio': round(ratio, 3), 'status': status})
+
+    for scale, current in report['scales'].items():
+        base = baseline.get('scales', {}).get(scale)
+        if base is None:
+            continue
+        add(scale, 'load.import_seconds', base['load']['import_seconds'], current['load']['import_seconds'])
+        add(scale, 'load.reload_from_cache_seconds', base['load']['reload_from_cache_seconds'],
+            current['load']['reload_from_cache_seconds'])
+        add(scale, 'peak_rss_mb', base['peak_rss_mb'], current['peak_rss_mb'])
+        if 'dataset_memory_mb' in base:
+            add(scale, 'dataset_memory_mb.prepared', base['dataset_memory_mb']['prepared']['total'],
+                current['dataset_memory_mb']['prepared']['total'])
+        for section in ('callbacks', 'callbacks_cached'):
+            for name, stats in current[section].items():
+                base_stats = base.get(section, {}).get(name)
+                if base_stats is None:
+                    continue
+                for metric in COMPARED_METRICS:
+                    add(scale, f'{section}.{name}.{metric}', base_stats[metric], stats[metric])
+    return rows
+
+
+def print_report(report):
+    for scale, result in report['scales'].items():
+        print(f'\n{scale}: {result["countries"]} стран x {result["days"]} дней = {result["rows"]:,} строк, '
+              f'загрузка {result["load"]["import_seconds"]:.2f} с '
+              f'(из кэша {result["load"]["reload_from_cache_seconds"]:.2f} с, без кэша подготовленных '
+              f'наборов {result["load"]["reload_without_prepared_cache_seconds"]:.2f} с), '
+              f'пик памяти {result["peak_rss_mb"]:.0f} МБ')
+        memory = result['dataset_memory_mb']
+        print(f'Память данных: исходные кадры {memory["source"]["total"]:.1f} МБ, '
+              f'компактные {memory["compact"]["total"]:.1f} МБ, с индексами {memory["prepared"]["total"]:.1f} МБ')
+        print(f'{"колбэк":>30}{"p50, мс":>10}{"p95, мс":>10}{"p99, мс":>10}{"ответ, байт":>14}')
+        for section in ('callbacks', 'callbacks_cached'):
+            for name, stats in result[section].items():
+                label = name if section == 'callbacks' else f'{name} (кэш)'
+                print(f'{label:>30}{stats["p50_ms"]:>10.1f}{stats["p95_ms"]:>10.1f}'
+                      f'{stats["p99_ms"]:>10.1f}{stats["response_bytes"]:>14,}')
+
+
+def print_comparison(rows):
+    changed = [row for row in rows if row['status'] != 'так же']
+    print(f'\nСравнение с базой: метрик {len(rows)}, изменились {len(changed)}')
+    for row in changed:
+        print(f'  [{row["status"]}] {row["scale"]} {row["metric"]}: '
+              f'{row["baseline"]} -> {row["current"]} (x{row["ratio"]})')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', default='1x', help='масштабы через запятую: ' + ', '.join(SCALES))
+    parser.add_argument('--samples', type=int, default=30, help='вызовов каждого колбэка')
+    parser.add_argument('--output', default='bench_report.json')
+    parser.add_argument('--baseline', help='базовый отчет для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое относительное изменение')
+    parser.add_argument('--fail-on-regression', action='store_true', help='код возврата 1 при регрессиях')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with tempfile.TemporaryDirectory() as workdir:
+            result = run_scale(args.worker, args.samples, workdir)
+        print(json.dumps(result))
+        return 0
+
+    report = {'environment': environment_info(), 'samples': args.samples, 'scales': {}}
+    for scale in args.scales.split(','):
+        if scale not in SCALES:
+            parser.error(f'неизвестный масштаб: {scale}')
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', scale,
+                                    '--samples', str(args.samples)],
+                                   stdout=subprocess.PIPE, check=True, text=True)
+        report['scales'][scale] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    print_report(report)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['comparison'] = compare(report, json.load(f), args.tolerance)
+        print_comparison(report['comparison'])
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'\nОтчет: {args.output}')
+
+    regressions = [row for row in report.get('comparison', []) if row['status'] == 'хуже']
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,452 @@
+# Нагрузочный тест: много одновременных пользователей дашборда.
+# Каждый виртуальный пользователь в своем потоке воспроизводит типичные
+# действия - переключение вкладок, пролистывание дат на карте, выбор страны,
+# сравнение стран - в виде тех же POST на /_dash-update-component, что
+# отправляет браузер. Число пользователей растет ступенями; для каждой
+# ступени - пропускная способность, перцентили задержки и доля ошибок.
+#
+# По умолчанию сервер запускается в отдельном процессе: один процесс Flask
+# (многопоточный сервер werkzeug) на синтетических данных и SQLite вместо
+# PostgreSQL (см. standin.py). Запуск из корня репозитория:
+#     python benchmarks/load_test.py --concurrency 1,4,16,32 --duration 10
+#
+# Уже запущенный сервер (например, gunicorn с несколькими воркерами):
+#     python benchmarks/load_test.py --url http://127.0.0.1:8050
+import argparse
+import gzip
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from standin import build_standin, dash_request_body, import_app  # noqa: E402
+
+MAP_OUTPUTS = [('world-map', 'figure'), ('map-legend-table', 'data'), ('map-legend-message', 'children'),
+               ('map-figure-kind', 'data')]
+GRAPH_OUTPUTS = [(graph_id, 'figure') for graph_id in ('hist-confirmed-graph', 'hist-deaths-graph',
+                                                       'ts-confirmed-graph', 'ts-deaths-graph',
+                                                       'box-confirmed-graph', 'box-deaths-graph')]
+GRAPH_OUTPUTS += [('graphs-message', 'children'), ('graphs-container', 'style'), ('graphs-filled', 'data')]
+COMPARE_OUTPUTS = [('compare-table', 'children'), ('compare-confirmed-graph', 'figure'),
+                   ('compare-deaths-graph', 'figure'), ('compare-message', 'children')]
+TABS = ('tab-map', 'tab-country', 'tab-compare')
+
+# Доли действий в смеси по умолчанию
+DEFAULT_MIX = 'tab=2,scrub=4,country=4,compare=1'
+
+# Сколько дат пролистывает пользователь за одно действие
+SCRUB_STEPS = 5
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Таймаут одного запроса, секунды: более долгий ответ считается ошибкой
+REQUEST_TIMEOUT = 60
+
+
+def render_content_body(tab):
+    return dash_request_body([('tabs-content', 'children')],
+                             [('tabs', 'value', tab), ('data-ready', 'data', True)],
+                             changed=[('tabs', 'value')])
+
+
+def map_body(date, figure_kind):
+    inputs = [('date-picker', 'date', date), ('map-mode', 'value', 'date'),
+              ('timelapse-stride', 'value', None), ('timelapse-max-frames', 'value', None)]
+    return dash_request_body(MAP_OUTPUTS, inputs, state=[('map-figure-kind', 'data', figure_kind)],
+                             changed=[('date-picker', 'date')])
+
+
+def tables_body(country):
+    return dash_request_body([('tables-container', 'children')], [('country-dropdown', 'value', country)],
+                             changed=[('country-dropdown', 'value')])
+
+
+def graphs_body(country, filled):
+    return dash_request_body(GRAPH_OUTPUTS, [('country-dropdown', 'value', country)],
+                             state=[('graphs-filled', 'data', filled)],
+                             changed=[('country-dropdown', 'value')])
+
+
+def compare_body(countries):
+    return dash_request_body(COMPARE_OUTPUTS, [('compare-dropdown', 'value', countries)],
+                             changed=[('compare-dropdown', 'value')])
+
+
+# Действия пользователя: список запросов (имя колбэка, тело). Состояние
+# пользователя (что уже нарисовано в браузере) определяет, придет ли
+# полная фигура или частичное обновление - как в настоящей сессии
+def tab_action(user, rng, catalog):
+    tab = TABS[rng.integers(len(TABS))]
+    user['map_kind'] = None
+    user['graphs_filled'] = False
+    return [('render_content', render_content_body(tab))]
+
+
+def scrub_action(user, rng, catalog):
+    dates = catalog['dates']
+    position = int(rng.integers(len(dates)))
+    requests = []
+    for _ in range(SCRUB_STEPS):
+        requests.append(('update_world_map', map_body(dates[position], user['map_kind'])))
+        user['map_kind'] = 'date'
+        position = min(position + int(rng.integers(1, 8)), len(dates) - 1)
+    return requests
+
+
+def country_action(user, rng, catalog):
+    country = catalog['countries'][rng.integers(len(catalog['countries']))]
+    requests = [('update_tables', tables_body(country)),
+                ('update_graphs', graphs_body(country, user['graphs_filled']))]
+    user['graphs_filled'] = True
+    return requests
+
+
+def compare_action(user, rng, catalog):
+    countries = catalog['countries']
+    size = int(rng.integers(2, min(10, len(countries)) + 1))
+    selected = [countries[i] for i in rng.choice(len(countries), size, replace=False)]
+    return [('update_comparison', compare_body(selected))]
+
+
+ACTIONS = {'tab': tab_action, 'scrub': scrub_action, 'country': country_action, 'compare': compare_action}
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name not in ACTIONS:
+            raise ValueError(f'неизвестное действие: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Connection:
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.conn = None
+
+    # Соединение держится открытым между запросами (keep-alive), как у браузера;
+    # сжатые ответы (gzip) принимаются так же. Возвращает статус, тело в том
+    # виде, в каком оно пришло, и его Content-Encoding
+    def post(self, path, body):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+        try:
+            self.conn.request('POST', path, body=body, headers={'Content-Type': 'application/json',
+                                                                'Accept-Encoding': 'gzip'})
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        if response.getheader('Connection', '').lower() == 'close':
+            self.close()
+        return response.status, data, response.getheader('Content-Encoding')
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def post_callback(connection, body):
+    return connection.post('/_dash-update-component', json.dumps(body).encode())
+
+
+# Компонент с заданным id в дереве, которое вернул render_content
+def find_component(node, component_id):
+    if isinstance(node, list):
+        for child in node:
+            found = find_component(child, component_id)
+            if found is not None:
+                return found
+    elif isinstance(node, dict):
+        props = node.get('props', {})
+        if props.get('id') == component_id:
+            return props
+        return find_component(props.get('children'), component_id)
+    return None
+
+
+# Даты и страны берутся из самого дашборда: из календаря вкладки карты
+# и выпадающего списка вкладки страны
+def fetch_catalog(url):
+    connection = Connection(url)
+    try:
+        layouts = {}
+        for tab in ('tab-map', 'tab-country'):
+            status, data, encoding = post_callback(connection, render_content_body(tab))
+            if status != 200:
+                raise RuntimeError(f'render_content({tab}): HTTP {status}')
+            if encoding == 'gzip':
+                data = gzip.decompress(data)
+            layouts[tab] = json.loads(data)['response']['tabs-content']['children']
+    finally:
+        connection.close()
+
+    picker = find_component(layouts['tab-map'], 'date-picker')
+    dropdown = find_component(layouts['tab-country'], 'country-dropdown')
+    if picker is None or dropdown is None:
+        raise RuntimeError('данные дашборда еще не загружены')
+    dates = [date.strftime('%Y-%m-%d') for date in
+             np.arange(np.datetime64(picker['min_date_allowed'][:10]),
+                       np.datetime64(picker['max_date_allowed'][:10]) + 1).astype('datetime64[s]').tolist()]
+    return {'dates': dates, 'countries': [option['value'] for option in dropdown['options']]}
+
+
+# Виртуальный пользователь: действия подряд до окончания ступени,
+# между действиями - пауза think_s
+def run_user(url, catalog, mix, seed, deadline, measure_from, think_s, samples):
+    rng = np.random.default_rng(seed)
+    names = list(mix)
+    weights = np.array([mix[name] for name in names])
+    weights = weights / weights.sum()
+    user = {'map_kind': None, 'graphs_filled': False}
+    connection = Connection(url)
+    try:
+        while time.perf_counter() < deadline:
+            action = names[rng.choice(len(names), p=weights)]
+            for callback, body in ACTIONS[action](user, rng, catalog):
+                if time.perf_counter() >= deadline:
+                    break
+                started_at = time.perf_counter()
+                try:
+                    status, data, _ = post_callback(connection, body)
+                    nbytes = len(data)
+                except (OSError, http.client.HTTPException):
+                    status, nbytes = None, 0
+                finished_at = time.perf_counter()
+                if started_at >= measure_from:
+                    samples.append((callback, finished_at - started_at, status, nbytes))
+            if think_s > 0:
+                time.sleep(think_s * rng.exponential())
+    finally:
+        connection.close()
+
+
+def latency_summary(latencies_s):
+    if not latencies_s:
+        return {}
+    latencies = np.asarray(latencies_s) * 1000
+    summary = {f'p{p}_ms': round(float(np.percentile(latencies, p)), 1) for p in PERCENTILES}
+    summary['max_ms'] = round(float(latencies.max()), 1)
+    return summary
+
+
+def summarize_stage(users, samples, seconds):
+    ok = [sample for sample in samples if sample[2] in (200, 204)]
+    result = {
+        'users': users,
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'error_rate': round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+        'throughput_rps': round(len(ok) / seconds, 2),
+        'response_mb_per_s': round(sum(sample[3] for sample in ok) / seconds / 2 ** 20, 2),
+        **latency_summary([sample[1] for sample in ok]),
+        'callbacks': {},
+    }
+    for callback in sorted({sample[0] for sample in samples}):
+        calls = [sample for sample in samples if sample[0] == callback]
+        calls_ok = [sample for sample in calls if sample[2] in (200, 204)]
+        result['callbacks'][callback] = {
+            'requests': len(calls),
+            'errors': len(calls) - len(calls_ok),
+            **latency_summary([sample[1] for sample in calls_ok]),
+        }
+    return result
+
+
+# Одна ступень: users потоков работают duration секунд; первые warmup
+# секунд не учитываются (соединения, первые промахи кэшей)
+def run_stage(url, catalog, mix, users, duration, warmup, think_s, seed):
+    samples = []
+    started_at = time.perf_counter()
+    measure_from = started_at + warmup
+    deadline = measure_from + duration
+    threads = [threading.Thread(target=run_user, daemon=True,
+                                args=(url, catalog, mix, seed * 1000 + i, deadline, measure_from, think_s, samples))
+               for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Запросы, начатые до конца ступени, могли закончиться позже
+    seconds = max(time.perf_counter() - measure_from, duration)
+    return summarize_stage(users, samples, seconds)
+
+
+# Сервер в отдельном процессе: синтетические данные, SQLite и многопоточный
+# werkzeug. Порт и готовность сообщаются первой строкой stdout
+def serve(args):
+    import logging
+
+    from werkzeug.serving import make_server
+
+    # Журнал каждого запроса werkzeug на такой нагрузке только мешает
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = build_standin(workdir, args.countries, args.days)
+        if args.no_cache:
+            env['COVID_CALLBACK_CACHE_ENTRIES'] = '0'
+        app_module = import_app(env)
+        server = make_server('127.0.0.1', args.port, app_module.server, threaded=True)
+        print(json.dumps({'port': server.server_port}), flush=True)
+        server.serve_forever()
+
+
+def start_server(args):
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--port', '0',
+               '--countries', str(args.countries), '--days', str(args.days)]
+    if args.no_cache:
+        command.append('--no-cache')
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line:
+        process.wait()
+        raise RuntimeError(f'сервер не запустился (код {process.returncode})')
+    return process, f'http://127.0.0.1:{json.loads(line)["port"]}'
+
+
+# Наибольшее число пользователей, при котором p95 укладывается в slo_ms
+# и нет ошибок - ориентир для выбора числа воркеров
+def sustainable_users(stages, slo_ms):
+    passing = [stage['users'] for stage in stages
+               if stage['errors'] == 0 and stage.get('p95_ms', float('inf')) <= slo_ms]
+    return max(passing) if passing else None
+
+
+# Сравнение с прошлым отчетом по ступеням с тем же числом пользователей:
+# падение пропускной способности, рост p95 или доли ошибок - регрессия
+def compare(report, baseline, tolerance):
+    rows = []
+    base_stages = {stage['users']: stage for stage in baseline.get('stages', [])}
+    for stage in report['stages']:
+        base = base_stages.get(stage['users'])
+        if base is None:
+            continue
+        for metric, higher_is_better in (('throughput_rps', True), ('p95_ms', False), ('error_rate', False)):
+            old, new = base.get(metric), stage.get(metric)
+            if old is None or new is None:
+                continue
+            if old == 0:
+                worse, better = new > 0, False
+                ratio = None
+            else:
+                ratio = round(new / old, 3)
+                worse = ratio < 1 - tolerance if higher_is_better else ratio > 1 + tolerance
+                better = ratio > 1 + tolerance if higher_is_better else ratio < 1 - tolerance
+            status = 'хуже' if worse else 'лучше' if better else 'так же'
+            rows.append({'users': stage['users'], 'metric': metric, 'baseline': old, 'current': new,
+                         'ratio': ratio, 'status': status})
+    return rows
+
+
+def print_stage(stage):
+    print(f'{stage["users"]:>6}{stage["requests"]:>9}{stage["throughput_rps"]:>10.1f}'
+          f'{stage.get("p50_ms", 0):>9.0f}{stage.get("p95_ms", 0):>9.0f}{stage.get("p99_ms", 0):>9.0f}'
+          f'{stage.get("max_ms", 0):>9.0f}{stage["error_rate"] * 100:>9.2f}')
+
+
+def print_callbacks(stage):
+    print(f'\nКолбэки при {stage["users"]} пользователях:')
+    print(f'{"колбэк":>20}{"запросы":>9}{"ошибки":>8}{"p50, мс":>9}{"p95, мс":>9}{"p99, мс":>9}')
+    for name, stats in stage['callbacks'].items():
+        print(f'{name:>20}{stats["requests"]:>9}{stats["errors"]:>8}{stats.get("p50_ms", 0):>9.0f}'
+              f'{stats.get("p95_ms", 0):>9.0f}{stats.get("p99_ms", 0):>9.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='адрес запущенного сервера; без него сервер запускается локально')
+    parser.add_argument('--countries', type=int, default=200, help='стран в синтетических данных')
+    parser.add_argument('--days', type=int, default=365, help='дней в синтетических данных')
+    parser.add_argument('--no-cache', action='store_true', help='выключить кэш ответов колбэков на сервере')
+    parser.add_argument('--concurrency', default='1,4,16,32', help='ступени: число пользователей через запятую')
+    parser.add_argument('--duration', type=float, default=10, help='длительность ступени, с')
+    parser.add_argument('--warmup', type=float, default=2, help='неучитываемое начало ступени, с')
+    parser.add_argument('--think-ms', type=float, default=0, help='средняя пауза между действиями, мс')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='доли действий: ' + ', '.join(ACTIONS))
+    parser.add_argument('--slo-ms', type=float, default=500, help='допустимый p95 для оценки емкости')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='load_report.json')
+    parser.add_argument('--baseline', help='прошлый отчет для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое относительное изменение')
+    parser.add_argument('--fail-on-regression', action='store_true', help='код возврата 1 при регрессиях')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return 0
+
+    mix = parse_mix(args.mix)
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server(args)
+    try:
+        catalog = fetch_catalog(url)
+        print(f'Сервер {url}: {len(catalog["countries"])} стран, {len(catalog["dates"])} дат, смесь {args.mix}')
+        print(f'{"польз.":>6}{"запросы":>9}{"зап./с":>10}{"p50, мс":>9}{"p95, мс":>9}{"p99, мс":>9}'
+              f'{"max, мс":>9}{"ошибки,%":>9}')
+        stages = []
+        for stage_number, users in enumerate(levels):
+            stage = run_stage(url, catalog, mix, users, args.duration, args.warmup,
+                              args.think_ms / 1000, args.seed + stage_number)
+            print_stage(stage)
+            stages.append(stage)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print_callbacks(stages[-1])
+    capacity = sustainable_users(stages, args.slo_ms)
+    print(f'\nБез ошибок и с p95 <= {args.slo_ms:.0f} мс: '
+          f'{capacity if capacity is not None else "ни одной ступени"} пользователей')
+
+    report = {
+        'url': args.url,
+        'countries': args.countries if args.url is None else None,
+        'days': args.days if args.url is None else None,
+        'callback_cache': not args.no_cache if args.url is None else None,
+        'mix': mix,
+        'duration_seconds': args.duration,
+        'think_ms': args.think_ms,
+        'slo_ms': args.slo_ms,
+        'sustainable_users': capacity,
+        'stages': stages,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['comparison'] = compare(report, json.load(f), args.tolerance)
+        changed = [row for row in report['comparison'] if row['status'] != 'так же']
+        print(f'\nСравнение с базой: метрик {len(report["comparison"])}, изменились {len(changed)}')
+        for row in changed:
+            print(f'  [{row["status"]}] {row["users"]} польз. {row["metric"]}: {row["baseline"]} -> {row["current"]}')
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'\nОтчет: {args.output}')
+
+    regressions = [row for row in report.get('comparison', []) if row['status'] == 'хуже']
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+# Локальная замена окружения приложения для замеров: синтетические файлы
+# в схеме materials/ и база SQLite со схемой geo_info вместо PostgreSQL.
+import importlib
+import json
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+DISEASE_COLUMNS = ['diabetes', 'obesity', 'smoking', 'copd', 'cvd', 'hiv', 'hypertension']
+
+
+# Синтетические данные: n_countries стран x n_days дней
+def make_datasets(n_countries, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    names = [f'Country {i:03d}' for i in range(n_countries)]
+    dates = pd.date_range('2020-01-22', periods=n_days)
+    n_rows = n_countries * n_days
+
+    daily = pd.DataFrame({
+        'name': np.repeat(names, n_days),
+        'observed_date': np.tile(dates, n_countries),
+        'confirmed_per_100k': rng.gamma(2.0, 10.0, n_rows).round(3),
+        'deaths_per_100k': rng.gamma(2.0, 0.5, n_rows).round(3),
+    })
+    coord = pd.DataFrame({
+        'name': names,
+        'longitude': rng.uniform(-180, 180, n_countries).round(2),
+        'latitude': rng.uniform(-60, 70, n_countries).round(2),
+    })
+    countries = pd.DataFrame({
+        'id': np.arange(1, n_countries + 1),
+        'name': names,
+        'iso2': [f'C{i % 100:02d}' for i in range(n_countries)],
+        'iso3': [f'C{i:03d}' for i in range(n_countries)],
+        'population': rng.integers(100_000, 100_000_000, n_countries),
+        'density': rng.uniform(1, 500, n_countries),
+        'prop_population_65': rng.uniform(1, 25, n_countries),
+        'prop_population_f': rng.uniform(45, 55, n_countries),
+    })
+    disease = pd.DataFrame({'country_id': countries['id']})
+    for col in DISEASE_COLUMNS:
+        disease[col] = rng.uniform(0, 20, n_countries)
+    risks = pd.DataFrame({
+        'ID страны': countries['id'],
+        'Риск общий': rng.uniform(0.1, 0.4, n_countries),
+        'Риск по возрасту': rng.uniform(0.1, 0.4, n_countries),
+        'Высокий риск госпитализации': rng.uniform(0.01, 0.1, n_countries),
+    })
+    return {'daily': daily, 'coord': coord, 'countries': countries, 'disease': disease, 'risks': risks}
+
+
+# Больше строк лист Excel не вмещает
+EXCEL_MAX_ROWS = 1_048_575
+
+
+# Записываем данные в workdir и возвращаем переменные окружения для приложения.
+# Если статистика не помещается в лист Excel (или excel=False), пишется
+# только заголовок книги, а сами строки кладутся в колоночный кэш
+# read_excel_cached - приложение загрузит их оттуда, минуя разбор Excel
+def build_standin(workdir, n_countries=200, n_days=365, seed=0, excel=True):
+    data = make_datasets(n_countries, n_days, seed)
+    materials_dir = os.path.join(workdir, 'materials')
+    os.makedirs(materials_dir, exist_ok=True)
+
+    daily_path = os.path.join(materials_dir, 'daily_statistics.xlsx')
+    if excel and len(data['daily']) <= EXCEL_MAX_ROWS:
+        data['daily'].to_excel(daily_path, index=False)
+    else:
+        if SRC_DIR not in sys.path:
+            sys.path.insert(0, SRC_DIR)
+        from data_loader import write_excel_cache
+
+        data['daily'].head(0).to_excel(daily_path, index=False)
+        write_excel_cache(daily_path, data['daily'], cache_dir=os.path.join(materials_dir, '.cache'))
+    data['coord'].to_excel(os.path.join(materials_dir, 'countries_coord.xlsx'), index=False)
+    # Тот же формат, что у materials/risks.csv: cp1251, «;», десятичная запятая
+    data['risks'].to_csv(os.path.join(materials_dir, 'risks.csv'), sep=';', decimal=',',
+                         encoding='cp1251', index=False)
+
+    db_path = os.path.join(workdir, 'geo_info.db')
+    with sqlite3.connect(db_path) as conn:
+        data['countries'].to_sql('countries', conn, index=False, if_exists='replace')
+        data['disease'].to_sql('disease_statistics', conn, index=False, if_exists='replace')
+
+    return {
+        'COVID_DB_URL': f'sqlite:///{db_path}',
+        'COVID_MATERIALS_DIR': materials_dir,
+        'COVID_SYNC_STARTUP': '1',
+    }
+
+
+# Импорт приложения с подменённым окружением (данные загружаются синхронно)
+def import_app(env):
+    os.environ.update(env)
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+
+    # data_loader мог быть импортирован при подготовке данных (см. build_standin)
+    # со старым окружением: перечитываем адрес базы и каталог материалов
+    if 'data_loader' in sys.modules:
+        importlib.reload(sys.modules['data_loader'])
+
+    import covid_app
+    return covid_app
+
+
+# Тело запроса к колбэку в том виде, в каком его отправляет браузер
+# на /_dash-update-component
+def dash_request_body(outputs, inputs, state=(), changed=()):
+    def props(items):
+        return [{'id': item_id, 'property': prop, 'value': value} for item_id, prop, value in items]
+
+    output_specs = [{'id': item_id, 'property': prop} for item_id, prop in outputs]
+    if len(outputs) == 1:
+        output = f'{outputs[0][0]}.{outputs[0][1]}'
+        output_specs = output_specs[0]
+    else:
+        output = '..' + '...'.join(f'{item_id}.{prop}' for item_id, prop in outputs) + '..'
+
+    return {
+        'output': output,
+        'outputs': output_specs,
+        'inputs': props(inputs),
+        'state': props(state),
+        'changedPropIds': [f'{item_id}.{prop}' for item_id, prop in changed],
+    }
+
+
+# Запрос к колбэку так же, как его отправляет браузер: POST на
+# /_dash-update-component. Возвращает разобранный ответ и его размер в байтах.
+def dash_request(client, outputs, inputs, state=(), changed=()):
+    body = dash_request_body(outputs, inputs, state, changed)
+    response = client.post('/_dash-update-component', data=json.dumps(body),
+                           content_type='application/json')
+    if response.status_code == 204:
+        return None, 0
+    if response.status_code != 200:
+        raise RuntimeError(f'{body["output"]}: HTTP {response.status_code}: {response.get_data(as_text=True)[:500]}')
+    return response.get_json(), len(response.get_data())
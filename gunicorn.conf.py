@@ -0,0 +1,51 @@
+# Конфигурация gunicorn с предзагрузкой данных в мастер-процессе.
+#
+# Запуск из корня репозитория:
+#     gunicorn -c gunicorn.conf.py --pythonpath src covid_app:server
+#
+# Мастер один раз загружает наборы данных (одно чтение Excel, одно
+# подключение к базе), сортирует их и строит массивы индексов
+# (data_loader.prepare_datasets; при повторном запуске они читаются из кэша
+# на диске, см. load_prepared_datasets), а затем публикует все в разделяемой
+# памяти; воркеры подключаются к ним без копирования, поэтому время старта
+# и суммарная память не растут с числом воркеров. Ответы колбэков воркеры делят
+# через общий SQLite-кэш (COVID_SHARED_CACHE_PATH).
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+bind = os.environ.get('COVID_BIND', '127.0.0.1:8050')
+workers = int(os.environ.get('COVID_WORKERS', '4'))
+
+_manifest_path = os.path.join(tempfile.gettempdir(), f'covid_datasets_{os.getpid()}.json')
+
+# Общий кэш ответов колбэков; воркеры наследуют переменную от мастера.
+# Файл, созданный по умолчанию, удаляется при остановке
+_own_callback_cache = 'COVID_SHARED_CACHE_PATH' not in os.environ
+_callback_cache_path = os.environ.setdefault(
+    'COVID_SHARED_CACHE_PATH', os.path.join(tempfile.gettempdir(), f'covid_callback_cache_{os.getpid()}.sqlite'))
+
+
+def on_starting(server):
+    from data_loader import create_db_engine, load_prepared_datasets
+    from shared_data import publish_datasets
+
+    engine = create_db_engine()
+    try:
+        publish_datasets(load_prepared_datasets(engine), _manifest_path)
+    finally:
+        engine.dispose()
+    server.log.info('Наборы данных опубликованы в разделяемой памяти: %s', _manifest_path)
+
+
+def on_exit(server):
+    from shared_data import release_datasets
+
+    release_datasets(unlink=True)
+    if os.path.exists(_manifest_path):
+        os.remove(_manifest_path)
+    for suffix in ('', '-wal', '-shm') if _own_callback_cache else ():
+        if os.path.exists(_callback_cache_path + suffix):
+            os.remove(_callback_cache_path + suffix)
@@ -0,0 +1,92 @@
+import numpy as np
+
+
+# Верхние границы размера агрегатов, чтобы объём фигуры не рос с длиной истории
+MAX_HISTOGRAM_BINS = 60
+MAX_BOX_OUTLIERS = 200
+
+
+def _finite(values):
+    values = np.asarray(values, dtype=float)
+    return values[np.isfinite(values)]
+
+
+# Гистограмма считается на сервере: в браузер уходят только границы и частоты.
+# Traces здесь и ниже - словари в формате plotly, без проверки свойств
+def histogram_trace(values, color, name):
+    values = _finite(values)
+    if values.size == 0:
+        return {'type': 'bar', 'x': [], 'y': [], 'marker': {'color': color}, 'name': name}
+
+    edges = np.histogram_bin_edges(values, bins='auto')
+    if len(edges) - 1 > MAX_HISTOGRAM_BINS:
+        edges = np.histogram_bin_edges(values, bins=MAX_HISTOGRAM_BINS)
+    counts, edges = np.histogram(values, bins=edges)
+
+    return {
+        'type': 'bar',
+        'x': (edges[:-1] + edges[1:]) / 2,
+        'y': counts,
+        'width': np.diff(edges),
+        'marker': {'color': color},
+        'name': name,
+        'hovertemplate': '%{customdata[0]:.2f} - %{customdata[1]:.2f}: %{y}<extra></extra>',
+        'customdata': np.column_stack([edges[:-1], edges[1:]])
+    }
+
+
+# Статистика ящика с усами в тех же определениях, что и у Plotly:
+# квартили с линейной интерполяцией, усы до крайних точек в пределах 1.5 IQR
+def box_statistics(values):
+    values = _finite(values)
+    if values.size == 0:
+        return None
+
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    lowerfence, upperfence = inside.min(), inside.max()
+
+    outliers = values[(values < lowerfence) | (values > upperfence)]
+    if outliers.size > MAX_BOX_OUTLIERS:
+        # Оставляем самые удаленные от медианы выбросы
+        order = np.argsort(np.abs(outliers - median))[::-1]
+        outliers = outliers[order[:MAX_BOX_OUTLIERS]]
+
+    return {
+        'q1': q1, 'median': median, 'q3': q3,
+        'lowerfence': lowerfence, 'upperfence': upperfence,
+        'mean': values.mean(), 'outliers': np.sort(outliers),
+    }
+
+
+# Ящик с усами из готовой статистики плюс выбросы отдельным trace
+def box_traces(values, color, name):
+    stats = box_statistics(values)
+    if stats is None:
+        return [{'type': 'box', 'x': [name], 'name': name, 'marker': {'color': color}}]
+
+    box = {
+        'type': 'box',
+        'x': [name],
+        'q1': [stats['q1']],
+        'median': [stats['median']],
+        'q3': [stats['q3']],
+        'lowerfence': [stats['lowerfence']],
+        'upperfence': [stats['upperfence']],
+        'mean': [stats['mean']],
+        'name': name,
+        'marker': {'color': color},
+        'boxmean': True
+    }
+    outliers = {
+        'type': 'scatter',
+        'x': [name] * len(stats['outliers']),
+        'y': stats['outliers'],
+        'mode': 'markers',
+        'marker': {'color': color, 'size': 4},
+        'name': name,
+        'showlegend': False,
+        'hoverinfo': 'y'
+    }
+    return [box, outliers]
@@ -0,0 +1,113 @@
+// Отрисовка карты в браузере по данным, загруженным один раз в dcc.Store.
+// Повторяет update_world_map: один trace, размер круга = случаи на 100к + 1
+// (в пределах 5..50), те же строки легенды и те же подписи.
+(function () {
+    function fmt(value, digits) {
+        return value === null ? 'nan' : value.toFixed(digits);
+    }
+
+    function component(type, props, children) {
+        return {
+            type: type,
+            namespace: 'dash_html_components',
+            props: Object.assign({}, props, {children: children})
+        };
+    }
+
+    function div(style, children) {
+        return component('Div', {style: style}, children);
+    }
+
+    function legendRow(name, color, confirmed) {
+        return {
+            marker: "<span style='color:" + color + ";font-size:18px'>●</span>",
+            name: name,
+            confirmed: confirmed === null ? null : Math.round(confirmed * 10) / 10
+        };
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        covidMap: {
+            renderMap: function (date, payload) {
+                var noUpdate = window.dash_clientside.no_update;
+                if (!payload || !date) {
+                    return [noUpdate, noUpdate, noUpdate];
+                }
+
+                if (!payload._dateRows) {
+                    payload._dateRows = {};
+                    payload.dates.forEach(function (day, idx) {
+                        payload._dateRows[day] = payload.rows[idx];
+                    });
+                }
+
+                var day = date.slice(0, 10);
+                var label = day.slice(8, 10) + '.' + day.slice(5, 7) + '.' + day.slice(0, 4);
+                var row = payload._dateRows[day];
+
+                if (!row) {
+                    var emptyFigure = {
+                        data: [],
+                        layout: Object.assign({}, payload.layout, {
+                            title: {text: 'Нет данных на ' + label, x: 0.5},
+                            annotations: []
+                        })
+                    };
+                    return [emptyFigure, [], div({color: 'red'}, 'Нет данных для отображения')];
+                }
+
+                var countries = payload.countries;
+                var lon = [], lat = [], size = [], color = [], text = [], rows = [];
+                row.i.forEach(function (countryIdx, k) {
+                    var confirmed = row.c[k];
+                    var deaths = row.d[k];
+                    var name = countries.name[countryIdx];
+                    lon.push(countries.lon[countryIdx]);
+                    lat.push(countries.lat[countryIdx]);
+                    size.push(Math.max(5, Math.min(50, (confirmed === null ? 0 : confirmed) + 1)));
+                    color.push(countries.color[countryIdx]);
+                    text.push(name + '<br>Случаев на 100к: ' + fmt(confirmed, 2) +
+                              '<br>Смертей на 100к: ' + fmt(deaths, 2));
+                    rows.push(legendRow(name, countries.color[countryIdx], confirmed));
+                });
+
+                var figure = {
+                    data: [{
+                        type: 'scattergeo',
+                        lon: lon,
+                        lat: lat,
+                        mode: 'markers',
+                        marker: {
+                            size: size,
+                            color: color,
+                            opacity: 0.8,
+                            line: {width: 1, color: 'darkgray'},
+                            sizemode: 'area'
+                        },
+                        text: text,
+                        hoverinfo: 'text',
+                        showlegend: false
+                    }],
+                    layout: Object.assign({}, payload.layout, {
+                        title: Object.assign({}, payload.layout.title, {
+                            text: 'Распространение COVID-19 на ' + label
+                        })
+                    })
+                };
+                return [figure, rows, null];
+            },
+
+            toggleDatePickers: function (mapMode) {
+                var show = {display: 'block'};
+                var hide = {display: 'none'};
+                if (mapMode === 'client') {
+                    return [hide, show, hide];
+                }
+                if (mapMode === 'range') {
+                    return [hide, hide, show];
+                }
+                return [show, hide, hide];
+            }
+        }
+    });
+})();
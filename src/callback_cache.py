@@ -0,0 +1,281 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from plotly.io.json import to_json_plotly
+from plotly.utils import PlotlyJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+logger = logging.getLogger(__name__)
+
+# Пределы кэша в памяти процесса: число записей и объем сериализованных ответов
+MEMORY_MAX_ENTRIES = int(os.environ.get('COVID_CALLBACK_CACHE_ENTRIES', '512'))
+MEMORY_MAX_BYTES = int(os.environ.get('COVID_CALLBACK_CACHE_MB', '64')) * 2 ** 20
+
+# Общий кэш на диске (SQLite) для всех воркеров; без пути не используется
+SHARED_CACHE_PATH = os.environ.get('COVID_SHARED_CACHE_PATH')
+SHARED_MAX_BYTES = int(os.environ.get('COVID_SHARED_CACHE_MB', '512')) * 2 ** 20
+
+# Сколько секунд действительна запись. Версия данных меняется только вместе
+# с наборами данных, а справочник стран перечитывается по своему TTL,
+# поэтому записи не должны жить дольше него (см. create_callback_cache)
+TTL_SECONDS = float(os.environ.get('COVID_CALLBACK_CACHE_TTL', '3600'))
+
+
+# Ответ колбэка в JSON: фигуры, компоненты Dash, Patch и no_update
+# превращаются в словари, которые Dash принимает обратно без изменений.
+# Сериализация та же, что у самого Dash, поэтому ответ из кэша совпадает
+# со свежим байт в байт
+def serialize(value):
+    return to_json_plotly(value).encode()
+
+
+# Ответ из кэша разбирается orjson (если установлен - тот же пакет
+# Plotly использует для сериализации): это заметно быстрее json.loads
+def deserialize(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Ключ записи: имя функции, аргументы и версия данных
+def make_key(name, args, version):
+    raw = json.dumps([name, args, version], cls=PlotlyJSONEncoder, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# LRU в памяти процесса с ограничением по числу записей, по байтам
+# и по времени жизни записи
+class MemoryStore:
+    def __init__(self, max_entries=MEMORY_MAX_ENTRIES, max_bytes=MEMORY_MAX_BYTES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            data, expires = entry
+            if time.monotonic() >= expires:
+                del self._entries[key]
+                self.nbytes -= len(data)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old[0])
+            self._entries[key] = (data, time.monotonic() + self.ttl)
+            self.nbytes += len(data)
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.nbytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.nbytes,
+                    'max_entries': self.max_entries, 'max_bytes': self.max_bytes, 'ttl': self.ttl,
+                    'evictions': self.evictions, 'expirations': self.expirations}
+
+
+# Общий кэш в файле SQLite: ответы сжаты zlib, при превышении объема
+# удаляются просроченные записи, а затем те, к которым дольше всего
+# не обращались. Время хранится по часам системы: файл общий для процессов
+class SQLiteStore:
+    def __init__(self, path=SHARED_CACHE_PATH, max_bytes=SHARED_MAX_BYTES, ttl=TTL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            # Файл от прежней версии без срока жизни записей: это только кэш,
+            # поэтому таблица создается заново
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(callback_cache)")}
+            if columns and 'expires' not in columns:
+                conn.execute("DROP TABLE callback_cache")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS callback_cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL,
+                    expires REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS callback_cache_accessed ON callback_cache (accessed)")
+
+    # Соединение на поток: sqlite3 не разрешает делить его между потоками
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value FROM callback_cache WHERE key = ? AND expires > ?", (key, now)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE callback_cache SET accessed = ? WHERE key = ?", (now, key))
+        return zlib.decompress(row[0])
+
+    def put(self, key, data):
+        value = zlib.compress(data, 1)
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO callback_cache (key, value, size, accessed, expires) "
+                         "VALUES (?, ?, ?, ?, ?)", (key, value, len(value), now, now + self.ttl))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM callback_cache").fetchone()[0]
+            if total > self.max_bytes:
+                self.evictions += conn.execute("DELETE FROM callback_cache WHERE expires <= ?", (now,)).rowcount
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM callback_cache").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total - self.max_bytes)
+
+    def _evict(self, conn, excess):
+        freed = 0
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM callback_cache ORDER BY accessed"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM callback_cache WHERE key = ?", stale)
+        self.evictions += len(stale)
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM callback_cache")
+
+    def stats(self):
+        entries, nbytes = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM callback_cache").fetchone()
+        return {'entries': entries, 'bytes': nbytes, 'max_bytes': self.max_bytes, 'ttl': self.ttl,
+                'evictions': self.evictions}
+
+
+# Двухуровневый кэш ответов колбэков: LRU в памяти и, если задан,
+# общий SQLite-кэш воркеров. Хранятся сериализованные ответы, поэтому
+# изменение возвращенного значения не портит кэш.
+class CallbackCache:
+    def __init__(self, memory=None, shared=None):
+        self.memory = memory or MemoryStore()
+        self.shared = shared
+        self._lock = threading.Lock()
+        self.counters = {}
+
+    def _count(self, name, outcome):
+        with self._lock:
+            counters = self.counters.setdefault(name, {'memory_hits': 0, 'shared_hits': 0, 'misses': 0})
+            counters[outcome] += 1
+
+    def get(self, name, key):
+        data = self.memory.get(key)
+        if data is not None:
+            self._count(name, 'memory_hits')
+            return deserialize(data)
+
+        if self.shared is not None:
+            try:
+                data = self.shared.get(key)
+            except sqlite3.Error:
+                logger.exception('Ошибка чтения общего кэша')
+                data = None
+            if data is not None:
+                self.memory.put(key, data)
+                self._count(name, 'shared_hits')
+                return deserialize(data)
+
+        self._count(name, 'misses')
+        return None
+
+    def put(self, key, value):
+        data = serialize(value)
+        self.memory.put(key, data)
+        if self.shared is not None:
+            try:
+                self.shared.put(key, data)
+            except sqlite3.Error:
+                logger.exception('Ошибка записи в общий кэш')
+
+    # Декоратор: результат функции кэшируется по имени, аргументам и версии
+    # данных, которую возвращает version(). Исключения (в том числе
+    # PreventUpdate) не кэшируются
+    def memoize(self, version, name=None):
+        def decorator(func):
+            cache_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args):
+                key = make_key(cache_name, args, version())
+                value = self.get(cache_name, key)
+                if value is None:
+                    value = func(*args)
+                    self.put(key, value)
+                return value
+            return wrapper
+        return decorator
+
+    def clear(self):
+        self.memory.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        with self._lock:
+            callbacks = {}
+            for name, counters in self.counters.items():
+                requests = sum(counters.values())
+                hits = counters['memory_hits'] + counters['shared_hits']
+                callbacks[name] = dict(counters, hit_rate=hits / requests if requests else 0.0)
+        stats = {'memory': self.memory.stats(), 'callbacks': callbacks}
+        if self.shared is not None:
+            stats['shared'] = self.shared.stats()
+        return stats
+
+
+# Кэш по настройкам окружения: общий SQLite-кэш, если задан COVID_SHARED_CACHE_PATH.
+# max_ttl - верхняя граница срока жизни записей (TTL данных, от которых зависят ответы)
+def create_callback_cache(max_ttl=None):
+    ttl = TTL_SECONDS if max_ttl is None else min(TTL_SECONDS, max_ttl)
+    shared = SQLiteStore(ttl=ttl) if SHARED_CACHE_PATH else None
+    return CallbackCache(memory=MemoryStore(ttl=ttl), shared=shared)
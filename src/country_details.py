@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from data_loader import lookup_risk
+from instrumentation import in_scope
+
+
+# Потоки для одновременных запросов данных страны
+DETAIL_WORKERS = int(os.environ.get('COVID_DETAIL_WORKERS', '4'))
+
+# Сколько последних результатов хранится и сколько секунд они действительны
+DETAIL_MAX_ENTRIES = 64
+DETAIL_TTL_SECONDS = float(os.environ.get('COVID_DETAIL_TTL', '60'))
+
+
+# Данные страны для вкладки «Информация по стране»: строка geo_info.countries,
+# статистика болезней, риски и временной ряд. id страны берется из справочника
+# в памяти, поэтому все четыре запроса идут одновременно в пуле потоков и
+# время загрузки равно самому долгому из них, а не их сумме.
+# update_tables и update_graphs срабатывают на один и тот же выбор страны:
+# второй колбэк ждет уже начатую загрузку и получает тот же результат.
+class CountryDetailsLoader:
+    def __init__(self, max_workers=DETAIL_WORKERS, max_entries=DETAIL_MAX_ENTRIES, ttl=DETAIL_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='covid-details')
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.loads = 0
+        self.shared = 0
+
+    # Результат - словарь: country (строка или None), disease, risk,
+    # daily (блок country_store) и version (версия данных страны)
+    def load(self, name, repository, store, risk_df):
+        key = (name, store.version(name))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is repository and time.monotonic() - entry[2] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.shared += 1
+                future = entry[0]
+                owner = False
+            else:
+                future = Future()
+                self._entries[key] = (future, repository, time.monotonic())
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self.loads += 1
+                owner = True
+
+        if owner:
+            try:
+                future.set_result(self._fetch(name, repository, store, risk_df, key[1]))
+            except Exception as error:
+                # Ошибку получат и те, кто ждет; следующий вызов загрузит заново
+                with self._lock:
+                    if self._entries.get(key, (None,))[0] is future:
+                        del self._entries[key]
+                future.set_exception(error)
+        return future.result()
+
+    def _fetch(self, name, repository, store, risk_df, version):
+        submit = lambda func, *args: self._executor.submit(in_scope(func), *args)
+
+        daily = submit(store.get, name)
+        country_id = repository.country_id(name)
+        if country_id is None:
+            # Страны нет в справочнике: без ее id остальное запросить нельзя
+            country = repository.get_country(name)
+            if country is None:
+                return {'country': None, 'disease': None, 'risk': None, 'daily': daily.result(), 'version': version}
+            country_id = int(country['id'])
+        else:
+            country = submit(repository.get_country, name)
+
+        disease = submit(repository.get_disease_stats, country_id)
+        risk = submit(lookup_risk, risk_df, country_id)
+        return {
+            'country': country.result() if isinstance(country, Future) else country,
+            'disease': disease.result(),
+            'risk': risk.result(),
+            'daily': daily.result(),
+            'version': version,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'loads': self.loads, 'shared': self.shared}
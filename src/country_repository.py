@@ -0,0 +1,195 @@
+import logging
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from instrumentation import phase, record_rows
+
+
+logger = logging.getLogger(__name__)
+
+# Колонки таблицы geo_info.disease_statistics, которые показываются в таблицах
+DISEASE_COLUMNS = ['diabetes', 'obesity', 'smoking', 'copd', 'cvd', 'hiv', 'hypertension']
+
+# Через сколько секунд статистика болезней перечитывается из базы
+DEFAULT_TTL_SECONDS = 3600
+
+# Через сколько секунд повторить неудачное обновление
+REFRESH_RETRY_SECONDS = 60
+
+# Отметка «в базе нет строки»: промахи тоже запоминаются до следующего обновления
+_MISSING = object()
+
+
+# Справочник стран для вкладки «Информация по стране».
+# Строки стран берутся из уже загруженного df_countries, статистика болезней
+# загружается одним запросом в словарь по country_id. В базу запрос уходит
+# только при первом промахе - параметризованный, через пул соединений engine;
+# отсутствие строки тоже запоминается. По истечении ttl статистика
+# перечитывается в фоне, а запросы до тех пор обслуживаются старыми данными.
+class CountryRepository:
+    def __init__(self, engine, df_countries, ttl=DEFAULT_TTL_SECONDS):
+        self.engine = engine
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._countries = df_countries.drop_duplicates('name').set_index('name', drop=False)
+        self._missing_countries = set()
+        self._disease_stats = {}
+        self._loaded = False
+        self._next_refresh = None
+        self._refreshing = False
+
+    # Полная перезагрузка статистики болезней одним запросом
+    def refresh(self):
+        query = text(f"SELECT country_id, {', '.join(DISEASE_COLUMNS)} FROM geo_info.disease_statistics")
+        with phase('query'), self.engine.connect() as conn:
+            disease_df = pd.read_sql_query(query, conn)
+        record_rows('query', len(disease_df))
+
+        disease_stats = {
+            int(row['country_id']): row[DISEASE_COLUMNS]
+            for _, row in disease_df.drop_duplicates('country_id').iterrows()
+        }
+        with self._lock:
+            self._disease_stats = disease_stats
+            self._missing_countries = set()
+            self._loaded = True
+            self._next_refresh = time.monotonic() + self.ttl
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception('Не удалось обновить статистику болезней, используются прежние данные')
+            with self._lock:
+                self._next_refresh = time.monotonic() + REFRESH_RETRY_SECONDS
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    # Первая загрузка идет в вызывающем потоке: без нее отвечать нечем.
+    # Дальше устаревшие данные обновляются в фоновом потоке
+    def _ensure_fresh(self):
+        if not self._loaded:
+            self.refresh()
+            return
+
+        with self._lock:
+            if self._refreshing or time.monotonic() < self._next_refresh:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, name='covid-disease-refresh', daemon=True).start()
+
+    # id страны по названию из справочника в памяти (None при промахе)
+    def country_id(self, name):
+        countries = self._countries
+        if name not in countries.index:
+            return None
+        return int(countries.loc[name, 'id'])
+
+    # Дописывает в справочник строки из базы. Повторы по названию (в самой
+    # выборке или уже добавленные параллельным запросом) отбрасываются:
+    # иначе .loc по названию вернул бы кадр вместо строки
+    def _add_countries(self, df):
+        with self._lock:
+            df = df.drop_duplicates('name')
+            df = df[~df['name'].isin(self._countries.index)]
+            if not df.empty:
+                self._countries = pd.concat([self._countries, df.set_index('name', drop=False)])
+
+    # Строка geo_info.countries по названию страны (None, если страны нет)
+    def get_country(self, name):
+        if name in self._countries.index:
+            return self._countries.loc[name]
+        if name in self._missing_countries:
+            return None
+
+        query = text("SELECT * FROM geo_info.countries WHERE name = :name")
+        with phase('query'), self.engine.connect() as conn:
+            df = pd.read_sql_query(query, conn, params={'name': name})
+        record_rows('query', len(df))
+        if df.empty:
+            with self._lock:
+                self._missing_countries.add(name)
+            return None
+
+        self._add_countries(df)
+        return self._countries.loc[name]
+
+    # Строки geo_info.countries для списка названий (в порядке списка,
+    # без отсутствующих). Недостающие страны запрашиваются одним запросом
+    def get_countries(self, names):
+        names = list(dict.fromkeys(names))
+        missing = [name for name in names
+                   if name not in self._countries.index and name not in self._missing_countries]
+        if missing:
+            query = text("SELECT * FROM geo_info.countries WHERE name IN :names").bindparams(
+                bindparam('names', expanding=True))
+            with phase('query'), self.engine.connect() as conn:
+                df = pd.read_sql_query(query, conn, params={'names': missing})
+            record_rows('query', len(df))
+            self._add_countries(df)
+            with self._lock:
+                self._missing_countries.update(set(missing) - set(df['name']))
+
+        countries = self._countries
+        return countries.loc[[name for name in names if name in countries.index]]
+
+    # Статистика болезней по id страны (None, если данных нет)
+    def get_disease_stats(self, country_id):
+        self._ensure_fresh()
+        country_id = int(country_id)
+
+        stats = self._disease_stats.get(country_id)
+        if stats is _MISSING:
+            return None
+        if stats is not None:
+            return stats
+
+        query = text(f"""
+            SELECT {', '.join(DISEASE_COLUMNS)}
+            FROM geo_info.disease_statistics
+            WHERE country_id = :country_id
+        """)
+        with phase('query'), self.engine.connect() as conn:
+            df = pd.read_sql_query(query, conn, params={'country_id': country_id})
+        record_rows('query', len(df))
+        if df.empty:
+            with self._lock:
+                self._disease_stats[country_id] = _MISSING
+            return None
+
+        stats = df.iloc[0]
+        with self._lock:
+            self._disease_stats[country_id] = stats
+        return stats
+
+    # Статистика болезней для списка id: кадр с индексом country_id
+    # (страны без данных пропускаются). Промахи - одним запросом
+    def get_disease_stats_many(self, country_ids):
+        self._ensure_fresh()
+        country_ids = list(dict.fromkeys(int(country_id) for country_id in country_ids))
+
+        missing = [country_id for country_id in country_ids if country_id not in self._disease_stats]
+        if missing:
+            query = text(f"""
+                SELECT country_id, {', '.join(DISEASE_COLUMNS)}
+                FROM geo_info.disease_statistics
+                WHERE country_id IN :country_ids
+            """).bindparams(bindparam('country_ids', expanding=True))
+            with phase('query'), self.engine.connect() as conn:
+                df = pd.read_sql_query(query, conn, params={'country_ids': missing})
+            record_rows('query', len(df))
+            with self._lock:
+                for country_id in missing:
+                    self._disease_stats[country_id] = _MISSING
+                for _, row in df.drop_duplicates('country_id').iterrows():
+                    self._disease_stats[int(row['country_id'])] = row[DISEASE_COLUMNS]
+
+        disease_stats = self._disease_stats
+        found = [country_id for country_id in country_ids
+                 if disease_stats.get(country_id, _MISSING) is not _MISSING]
+        return pd.DataFrame([disease_stats[country_id] for country_id in found],
+                            index=pd.Index(found, name='country_id'), columns=DISEASE_COLUMNS)
@@ -0,0 +1,125 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from schema import DAY_COLUMN
+
+
+def _name_codes(names):
+    if isinstance(names.dtype, pd.CategoricalDtype):
+        return names.cat.codes.to_numpy().astype('int64')
+    return pd.factorize(names)[0]
+
+
+# Статистика, в которой строки каждой страны лежат подряд по возрастанию дня.
+# Сортировка выполняется один раз при загрузке; уже упорядоченный кадр
+# (например, опубликованный мастер-процессом) возвращается как есть
+def sort_by_country(df):
+    if _grouped_by_country(df):
+        return df
+    return df.sort_values(['name', DAY_COLUMN], kind='stable').reset_index(drop=True)
+
+
+def _grouped_by_country(df):
+    name_steps = np.diff(_name_codes(df['name']))
+    day_steps = np.diff(df[DAY_COLUMN].to_numpy().astype('int64'))
+    return bool(np.all((name_steps > 0) | ((name_steps == 0) & (day_steps >= 0))))
+
+
+# Блоки стран - срезы отсортированного кадра по смещениям, без копирования
+# данных: для опубликованных в разделяемой памяти данных (см. shared_data)
+# блоки смотрят прямо в общие массивы
+def _split_by_country(df):
+    df = sort_by_country(df)
+    if df.empty:
+        return {}
+    codes = _name_codes(df['name'])
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate([[0], bounds])
+    stops = np.concatenate([bounds, [len(df)]])
+    names = df['name']
+    return {
+        str(names.iat[start]): df.iloc[start:stop].reset_index(drop=True)
+        for start, stop in zip(starts, stops)
+    }
+
+
+# Хранилище временных рядов по странам: блок каждой страны - непрерывный
+# срез статистики, отсортированной по дате (см. _split_by_country).
+# Колбэкам остаётся взять блок по ключу без фильтрации всей таблицы.
+# Сглаженные и производные колонки уже посчитаны (см. derived_metrics).
+class CountryStore:
+    def __init__(self, daily_stats_df, version=1):
+        self._blocks = _split_by_country(daily_stats_df)
+        self._pending = {}
+        self._versions = dict.fromkeys(self._blocks, version)
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self._blocks
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def names(self):
+        return list(self._blocks)
+
+    # Версия данных страны: меняется, только когда у страны появились новые строки
+    def version(self, name):
+        return self._versions.get(name, 0)
+
+    # Новое хранилище с добавленными строками. Неизменившиеся блоки общие
+    # со старым хранилищем; новые строки склеиваются с блоком страны лениво,
+    # при первом обращении, поэтому добавление стоит O(размер дельты).
+    def appended(self, delta, version):
+        store = CountryStore.__new__(CountryStore)
+        store._lock = threading.Lock()
+        with self._lock:
+            store._blocks = dict(self._blocks)
+            store._pending = {name: list(chunks) for name, chunks in self._pending.items()}
+        store._versions = dict(self._versions)
+
+        for name, chunk in _split_by_country(delta).items():
+            store._blocks.setdefault(name, chunk.iloc[:0])
+            store._pending.setdefault(name, []).append(chunk)
+            store._versions[name] = version
+        return store
+
+    # Последние строки стран одним кадром: хвост блока и еще не склеенные
+    # новые строки, без склейки всего блока
+    def tails(self, names, n_rows):
+        parts = []
+        with self._lock:
+            for name in names:
+                block = self._blocks.get(name)
+                if block is None:
+                    continue
+                chunks = self._pending.get(name, [])
+                parts.append(pd.concat([block.tail(n_rows)] + chunks).tail(n_rows))
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(parts, ignore_index=True)
+
+    # Блок данных страны (пустой кадр, если страны нет)
+    def get(self, name):
+        with self._lock:
+            block = self._blocks.get(name)
+            if block is None:
+                return pd.DataFrame()
+
+            chunks = self._pending.pop(name, None)
+            if chunks:
+                block = pd.concat([block] + chunks, ignore_index=True)
+                block = block.sort_values(DAY_COLUMN, kind='stable').reset_index(drop=True)
+                self._blocks[name] = block
+            return block
+
+    # Блоки нескольких стран в порядке списка (страны без данных пропускаются)
+    def get_many(self, names):
+        blocks = {}
+        for name in names:
+            block = self.get(name)
+            if not block.empty:
+                blocks[name] = block
+        return blocks
@@ -0,0 +1,48 @@
+import hashlib
+
+import pandas as pd
+
+from map_index import build_date_index
+from schema import DAY_COLUMN, day_to_timestamp
+
+
+# Снимок данных, которые меняются при поступлении новых строк: индекс карты
+# по датам, блоки стран, индекс агрегатов за период, границы дат, версия,
+# число добавленных строк и отпечаток содержимого (см. data_loader.
+# datasets_fingerprint). После создания снимок не меняется: новый
+# собирается в стороне (extended), и приложение подменяет одну ссылку.
+# Колбэк берет ссылку на снимок один раз и видит согласованные между
+# собой структуры, даже если во время ответа пришли новые строки.
+class DataSnapshot:
+    def __init__(self, date_index, country_store, range_index, min_day, max_day, version=1, ingested_rows=0,
+                 fingerprint=''):
+        self.date_index = date_index
+        self.country_store = country_store
+        self.range_index = range_index
+        self.min_day = min_day
+        self.max_day = max_day
+        self.min_date = day_to_timestamp(min_day)
+        self.max_date = day_to_timestamp(max_day)
+        self.version = version
+        self.ingested_rows = ingested_rows
+        self.fingerprint = fingerprint
+
+    # Снимок с добавленными строками. Индексы дополняются только новыми
+    # днями: кадры карты строятся для дельты, блоки стран дописываются
+    # лениво, столбцы агрегатов - в общие буферы, поэтому время зависит
+    # от размера дельты, а не от всей истории. Страны карты остаются
+    # прежними. Отпечаток продолжается хэшем строк дельты
+    def extended(self, delta):
+        version = self.version + 1
+        digest = hashlib.sha256(self.fingerprint.encode())
+        digest.update(pd.util.hash_pandas_object(delta, index=False).to_numpy().tobytes())
+        return DataSnapshot(
+            self.date_index.extended(build_date_index(delta, self.date_index.countries)),
+            self.country_store.appended(delta, version),
+            self.range_index.extended(delta),
+            self.min_day,
+            max(self.max_day, int(delta[DAY_COLUMN].max())),
+            version,
+            self.ingested_rows + len(delta),
+            digest.hexdigest(),
+        )
@@ -0,0 +1,128 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from schema import DAY_COLUMN
+
+
+# Показатели, для которых считаются производные ряды
+METRIC_COLUMNS = ['confirmed_per_100k', 'deaths_per_100k']
+
+# Окно сглаживания в днях (скользящее среднее)
+SMOOTHING_WINDOW = int(os.environ.get('COVID_SMOOTHING_WINDOW', '7'))
+
+# Окна заболеваемости: сумма значений на 100 тысяч за 7 и 14 дней
+INCIDENCE_WINDOWS = (7, 14)
+
+# Прирост и время удвоения считаются неделя к неделе
+GROWTH_LAG_DAYS = 7
+
+# Сколько последних дней страны нужно, чтобы досчитать показатели для новых строк
+LOOKBACK_DAYS = max(SMOOTHING_WINDOW, *INCIDENCE_WINDOWS) + GROWTH_LAG_DAYS
+
+
+# Ключ строки: номер страны и день в одном int64. Данные отсортированы по нему,
+# поэтому начало окна любой строки находится двоичным поиском
+def _row_keys(codes, days):
+    return codes.astype('int64') * (1 << 32) + days.astype('int64')
+
+
+# Сумма значений и число непустых значений за окно [день - window + 1, день]
+# для каждой строки. Окна считаются по датам, а не по строкам, поэтому
+# пропущенные дни не сдвигают окно; пустые значения в сумму не входят.
+def grouped_window_sums(keys, values, window):
+    filled = np.nan_to_num(values, nan=0.0)
+    value_sums = np.concatenate([[0.0], np.cumsum(filled)])
+    counts = np.concatenate([[0], np.cumsum(~np.isnan(values))])
+
+    starts = np.searchsorted(keys, keys - window, side='right')
+    ends = np.arange(1, len(keys) + 1)
+    return value_sums[ends] - value_sums[starts], counts[ends] - counts[starts]
+
+
+# Значение той же страны lag дней назад (NaN, если такого дня нет)
+def grouped_lag(keys, values, lag):
+    positions = np.searchsorted(keys, keys - lag)
+    positions = np.minimum(positions, len(keys) - 1)
+    found = keys[positions] == keys - lag
+    return np.where(found, values[positions], np.nan)
+
+
+# Нарастающий итог по стране: общий cumsum минус итог до первой строки страны
+def grouped_cumsum(codes, values):
+    filled = np.nan_to_num(values, nan=0.0)
+    totals = np.cumsum(filled)
+    group_starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    group_ids = np.cumsum(np.r_[True, codes[1:] != codes[:-1]]) - 1
+    offsets = totals[group_starts] - filled[group_starts]
+    return totals - offsets[group_ids]
+
+
+# Производные ряды для одного показателя
+def _metric_columns(col, keys, codes, values, cumulative_offsets):
+    columns = {}
+
+    window_sums, window_counts = grouped_window_sums(keys, values, SMOOTHING_WINDOW)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        columns[f'{col}_smoothed'] = np.where(window_counts > 0, window_sums / window_counts, np.nan)
+
+    for window in INCIDENCE_WINDOWS:
+        columns[f'{col}_incidence_{window}d'], _ = grouped_window_sums(keys, values, window)
+
+    # Прирост за неделю: заболеваемость за 7 дней к такой же неделей раньше
+    weekly = columns[f'{col}_incidence_7d']
+    previous_weekly = grouped_lag(keys, weekly, GROWTH_LAG_DAYS)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        columns[f'{col}_growth_rate'] = np.where(previous_weekly > 0, weekly / previous_weekly - 1, np.nan)
+
+    # Время удвоения нарастающего итога при текущем недельном темпе
+    cumulative = grouped_cumsum(codes, values) + cumulative_offsets
+    previous_cumulative = grouped_lag(keys, cumulative, GROWTH_LAG_DAYS)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        daily_rate = np.log(cumulative / previous_cumulative) / GROWTH_LAG_DAYS
+        columns[f'{col}_doubling_days'] = np.where(daily_rate > 0, np.log(2) / daily_rate, np.nan)
+
+    columns[f'{col}_cumulative'] = cumulative
+    return columns
+
+
+# Добавляем производные колонки (float32) к компактной ежедневной статистике.
+# Все расчеты - по отсортированным массивам NumPy, без groupby().apply().
+# history - последние строки стран с уже посчитанными колонками (см. LOOKBACK_DAYS):
+# с ней показатели для новых строк досчитываются без пересчета всей истории.
+# Готовые сглаженные колонки из источника сохраняются как есть.
+def add_derived_metrics(daily_stats_df, history=None):
+    df = daily_stats_df.copy()
+    df['_new'] = True
+    if history is not None and not history.empty:
+        context = history[[col for col in history.columns if col in df.columns or col.endswith('_cumulative')]].copy()
+        context['_new'] = False
+        df = pd.concat([context, df], ignore_index=True)
+
+    names = df['name'].astype(str)
+    df = df.assign(name=names).sort_values(['name', DAY_COLUMN], kind='stable').reset_index(drop=True)
+    codes = pd.factorize(df['name'])[0]
+    keys = _row_keys(codes, df[DAY_COLUMN].to_numpy())
+
+    for col in METRIC_COLUMNS:
+        values = df[col].to_numpy(dtype='float64')
+
+        # Итог до первой строки страны берем из истории, если она есть
+        cumulative_col = f'{col}_cumulative'
+        cumulative_offsets = 0.0
+        if cumulative_col in df.columns:
+            known = df[cumulative_col].to_numpy(dtype='float64')
+            first = np.r_[True, codes[1:] != codes[:-1]]
+            starts = np.where(first & ~np.isnan(known), known - np.nan_to_num(values, nan=0.0), 0.0)
+            cumulative_offsets = np.maximum.accumulate(np.where(first, np.arange(len(df)), 0))
+            cumulative_offsets = starts[cumulative_offsets]
+
+        for name, column in _metric_columns(col, keys, codes, values, cumulative_offsets).items():
+            if name.endswith('_smoothed') and name in daily_stats_df.columns:
+                continue
+            df[name] = column.astype('float32')
+
+    df = df[df.pop('_new').to_numpy()]
+    df['name'] = df['name'].astype(daily_stats_df['name'].dtype)
+    return df.reset_index(drop=True)
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+
+# Сколько точек временного ряда отправляется в браузер за раз
+DEFAULT_POINT_BUDGET = 1000
+
+
+# Min-max прореживание: ряд делится на корзины, в каждой оставляются
+# минимум и максимум, поэтому пики сохраняются. Полностью векторное:
+# сортировка по (корзина, значение) даёт min первым, а max последним.
+def minmax_indices(y, n_out):
+    n = len(y)
+    if n <= n_out or n_out < 4:
+        return np.arange(n)
+
+    n_buckets = (n_out - 2) // 2
+    buckets = np.arange(n) * n_buckets // n
+    order = np.lexsort((y, buckets))
+
+    starts = np.searchsorted(buckets[order], np.arange(n_buckets), side='left')
+    ends = np.searchsorted(buckets[order], np.arange(n_buckets), side='right') - 1
+
+    indices = np.concatenate([order[starts], order[ends], [0, n - 1]])
+    return np.unique(indices)
+
+
+# Прореживание ряда дат и значений под бюджет точек; при заданном окне
+# [start, end] берутся только видимые точки плюс по одной за краями
+def downsample_series(dates, values, n_out=DEFAULT_POINT_BUDGET, start=None, end=None):
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    values = np.asarray(values, dtype=float)
+
+    mask = ~np.isnan(values)
+    dates, values = dates[mask], values[mask]
+
+    if start is not None or end is not None:
+        lo = 0 if start is None else max(np.searchsorted(dates, np.datetime64(pd.Timestamp(start)), 'left') - 1, 0)
+        hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(end)), 'right') + 1
+        dates, values = dates[lo:hi], values[lo:hi]
+
+    indices = minmax_indices(values, n_out)
+    return dates[indices], values[indices]
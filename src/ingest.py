@@ -0,0 +1,194 @@
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from data_loader import MATERIALS_DIR
+from derived_metrics import add_derived_metrics
+from instrumentation import instrumented, phase, record_rows
+from schema import DATE_COLUMN, DAY_COLUMN, compact_daily_stats, dates_to_days
+
+
+logger = logging.getLogger(__name__)
+
+# Каталог, куда кладутся файлы с новыми строками ежедневной статистики
+INGEST_DIR = os.environ.get('COVID_INGEST_DIR', os.path.join(MATERIALS_DIR, 'incoming'))
+
+# Таблица в схеме geo_info с новыми строками (если не задана, база не опрашивается)
+INGEST_TABLE = os.environ.get('COVID_INGEST_TABLE')
+
+# Период опроса источников, секунды
+INGEST_INTERVAL_SECONDS = float(os.environ.get('COVID_INGEST_INTERVAL', '60'))
+
+
+# Файлы из каталога поступлений: .xlsx или .csv с колонками daily_statistics.xlsx.
+# Файлы не перемещаются, а запоминаются по (имя, mtime, размер): так каталог
+# могут читать несколько воркеров, а повторное чтение отсекает фильтр по дате.
+class DropFolderSource:
+    def __init__(self, folder=INGEST_DIR):
+        self.folder = folder
+        self._seen = set()
+
+    def __repr__(self):
+        return f'DropFolderSource({self.folder!r})'
+
+    def poll(self, max_day):
+        if not os.path.isdir(self.folder):
+            return []
+
+        frames = []
+        for file_name in sorted(os.listdir(self.folder)):
+            path = os.path.join(self.folder, file_name)
+            extension = os.path.splitext(file_name)[1].lower()
+            if extension not in ('.xlsx', '.csv') or not os.path.isfile(path):
+                continue
+
+            stat = os.stat(path)
+            key = (file_name, stat.st_mtime_ns, stat.st_size)
+            if key in self._seen:
+                continue
+
+            if extension == '.xlsx':
+                df = pd.read_excel(path)
+            else:
+                # Тот же формат CSV, что и у risks.csv
+                df = pd.read_csv(path, encoding='cp1251', sep=';', decimal=',', parse_dates=[DATE_COLUMN])
+            self._seen.add(key)
+            logger.info('Прочитан файл поступлений %s: %d строк', file_name, len(df))
+            frames.append(df)
+        return frames
+
+
+# Таблица geo_info.<table>: забираем строки с текущей максимальной даты и новее
+# (за сам последний день могут прийти строки стран, приславших данные позже)
+class TableSource:
+    def __init__(self, engine, table=INGEST_TABLE):
+        self.engine = engine
+        self.table = table
+
+    def __repr__(self):
+        return f'TableSource({self.table!r})'
+
+    def poll(self, max_day):
+        from sqlalchemy import text
+
+        query = text(f"SELECT * FROM geo_info.{self.table} WHERE {DATE_COLUMN} >= :max_date")
+        max_date = pd.Timestamp(int(max_day), unit='D').to_pydatetime()
+        with self.engine.connect() as conn:
+            df = pd.read_sql_query(query, conn, params={'max_date': max_date}, parse_dates=[DATE_COLUMN])
+        return [df] if not df.empty else []
+
+
+# Новые строки в тех же компактных типах, что и загруженная статистика.
+# Остаются дни новее max_day и строки за сам max_day от стран, у которых
+# этого дня еще нет (по последним строкам из get_history); повтор
+# (страна, день) - последняя строка. Отброшенные строки считаются в логе.
+# Производные показатели досчитываются по последним LOOKBACK_DAYS строкам
+# затронутых стран, которые возвращает get_history(names).
+def prepare_delta(raw_frames, reference_df, max_day, get_history=None):
+    raw = pd.concat(raw_frames, ignore_index=True)
+    if raw.empty:
+        return None
+
+    days = dates_to_days(raw[DATE_COLUMN])
+    if (days < max_day).any():
+        logger.info('Пропущено строк за дни до последнего загруженного: %d', int((days < max_day).sum()))
+    raw = raw[days >= max_day]
+    if raw.empty:
+        return None
+
+    delta = compact_daily_stats(raw)
+    delta = delta.drop_duplicates(['name', DAY_COLUMN], keep='last')
+
+    history = get_history(delta['name'].astype(str).unique()) if get_history is not None else None
+    late = (delta[DAY_COLUMN] == max_day).to_numpy()
+    if late.any():
+        if get_history is None:
+            # Без истории не проверить, есть ли уже этот день у страны
+            repeated = late
+            logger.info('Пропущено строк за последний загруженный день: %d', int(repeated.sum()))
+        else:
+            loaded = history.loc[history[DAY_COLUMN] == max_day, 'name'] if not history.empty else []
+            repeated = late & delta['name'].astype(str).isin(pd.Index(loaded).astype(str)).to_numpy()
+            logger.debug('Строк за последний день, которые уже загружены: %d', int(repeated.sum()))
+        delta = delta[~repeated]
+        if delta.empty:
+            return None
+
+    delta = add_derived_metrics(delta, history)
+
+    # Колонки и типы - как у исходной таблицы; категории названий
+    # сохраняются, чтобы блоки стран склеивались без смены типа
+    delta = delta.reindex(columns=reference_df.columns)
+    categories = reference_df['name'].cat.categories
+    names = delta['name'].astype(str)
+    new_names = pd.Index(names.unique()).difference(categories)
+    delta['name'] = pd.Categorical(names, categories=categories.append(new_names))
+    for col in reference_df.columns:
+        if col != 'name':
+            delta[col] = delta[col].astype(reference_df[col].dtype)
+    return delta.reset_index(drop=True)
+
+
+# Фоновый опрос источников. get_max_day возвращает текущий последний день,
+# get_history - последние строки стран (см. prepare_delta), apply_delta применяет
+# подготовленные строки (см. covid_app.ingest_delta)
+class IngestionService:
+    def __init__(self, sources, reference_df, get_max_day, apply_delta, get_history=None,
+                 interval=INGEST_INTERVAL_SECONDS):
+        self.sources = sources
+        self.reference_df = reference_df
+        self.get_max_day = get_max_day
+        self.get_history = get_history
+        self.apply_delta = apply_delta
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Один проход по источникам; возвращает число добавленных строк
+    @instrumented('ingest')
+    def poll_once(self):
+        max_day = self.get_max_day()
+        raw_frames = []
+        with phase('query'):
+            for source in self.sources:
+                try:
+                    raw_frames.extend(source.poll(max_day))
+                except Exception:
+                    logger.exception('Ошибка опроса источника %r', source)
+        if not raw_frames:
+            return 0
+
+        with phase('filter'):
+            delta = prepare_delta(raw_frames, self.reference_df, max_day, self.get_history)
+        if delta is None:
+            return 0
+        record_rows('filter', len(delta))
+
+        with phase('merge'):
+            self.apply_delta(delta)
+        return len(delta)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll_once()
+            except Exception:
+                logger.exception('Ошибка загрузки новых данных')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='covid-ingest', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+# Источники по настройкам окружения: каталог поступлений всегда,
+# таблица базы - если задана COVID_INGEST_TABLE
+def default_sources(engine):
+    sources = [DropFolderSource()]
+    if INGEST_TABLE:
+        sources.append(TableSource(engine))
+    return sources
@@ -0,0 +1,283 @@
+import functools
+import io
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import flask
+from dash.exceptions import PreventUpdate
+
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм: длительности в секундах и размеры ответов в байтах
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7)
+
+# Профилирование медленных вызовов: порог в мс (0 - выключено), доля
+# профилируемых вызовов, каталог отчетов и профилировщик (cprofile или pyinstrument)
+PROFILE_SLOW_MS = float(os.environ.get('COVID_PROFILE_SLOW_MS', '0'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('COVID_PROFILE_SAMPLE_RATE', '1.0'))
+PROFILE_DIR = os.environ.get('COVID_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'covid_profiles'))
+PROFILER = os.environ.get('COVID_PROFILER', 'cprofile')
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+# Метрики процесса. Под gunicorn у каждого воркера свои значения
+# (Prometheus различает их по адресу, с которого снимает метрики)
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = {}
+        self.payload_bytes = {}
+        self.calls = defaultdict(int)
+        self.rows = defaultdict(int)
+
+    def observe_phase(self, scope, phase, seconds):
+        with self._lock:
+            histogram = self.phases.get((scope, phase))
+            if histogram is None:
+                histogram = self.phases[(scope, phase)] = Histogram(DURATION_BUCKETS)
+            histogram.observe(seconds)
+
+    def observe_payload(self, scope, nbytes, encoding='identity'):
+        with self._lock:
+            histogram = self.payload_bytes.get((scope, encoding))
+            if histogram is None:
+                histogram = self.payload_bytes[(scope, encoding)] = Histogram(BYTES_BUCKETS)
+            histogram.observe(nbytes)
+
+    def count_call(self, scope, status):
+        with self._lock:
+            self.calls[(scope, status)] += 1
+
+    def add_rows(self, scope, phase, n_rows):
+        with self._lock:
+            self.rows[(scope, phase)] += int(n_rows)
+
+    # Текст в формате Prometheus (text/plain; version=0.0.4)
+    def render(self, extra=()):
+        out = io.StringIO()
+        with self._lock:
+            _render_histograms(out, 'covid_phase_seconds', 'Длительность фаз колбэков и загрузки, с',
+                               {('callback', 'phase'): self.phases})
+            _render_histograms(out, 'covid_response_bytes', 'Размер ответа колбэка (после сжатия), байт',
+                               {('callback', 'encoding'): self.payload_bytes})
+            _render_counter(out, 'covid_calls_total', 'Вызовы колбэков по результату',
+                            ('callback', 'status'), self.calls)
+            _render_counter(out, 'covid_rows_total', 'Обработано строк по фазам',
+                            ('callback', 'phase'), self.rows)
+        for name, kind, help_text, samples in extra:
+            out.write(f'# HELP {name} {help_text}\n# TYPE {name} {kind}\n')
+            for labels, value in samples:
+                out.write(f'{name}{_labels(labels)} {value}\n')
+        return out.getvalue()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _render_histograms(out, name, help_text, groups):
+    out.write(f'# HELP {name} {help_text}\n# TYPE {name} histogram\n')
+    for label_names, histograms in groups.items():
+        for label_values, histogram in sorted(histograms.items()):
+            labels = dict(zip(label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                out.write(f'{name}_bucket{_labels({**labels, "le": bound})} {cumulative}\n')
+            out.write(f'{name}_sum{_labels(labels)} {histogram.sum}\n')
+            out.write(f'{name}_count{_labels(labels)} {histogram.count}\n')
+
+
+def _render_counter(out, name, help_text, label_names, values):
+    out.write(f'# HELP {name} {help_text}\n# TYPE {name} counter\n')
+    for label_values, value in sorted(values.items()):
+        out.write(f'{name}{_labels(dict(zip(label_names, label_values)))} {value}\n')
+
+
+metrics = Metrics()
+
+# Текущий колбэк потока: фазы и строки записываются на его имя
+_local = threading.local()
+
+# Одновременно профилируется один вызов: профилировщики Python
+# не допускают нескольких активных профилей в процессе
+_profile_lock = threading.Lock()
+
+
+def current_scope():
+    return getattr(_local, 'scope', None) or 'background'
+
+
+# Замер фазы (query, filter, merge, figure, serialize...) текущего колбэка
+@contextmanager
+def phase(name):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe_phase(current_scope(), name, time.perf_counter() - started_at)
+
+
+def record_rows(phase_name, n_rows):
+    metrics.add_rows(current_scope(), phase_name, n_rows)
+
+
+# Функция, которая в другом потоке (пул, фоновая задача) записывает фазы
+# на колбэк, вызвавший in_scope, а не на 'background'
+def in_scope(func):
+    scope = getattr(_local, 'scope', None)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous_scope = getattr(_local, 'scope', None)
+        _local.scope = scope
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.scope = previous_scope
+    return wrapper
+
+
+def _start_profiler():
+    if PROFILE_SLOW_MS <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        return None
+
+    try:
+        if PROFILER == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                logger.warning('pyinstrument не установлен, используется cProfile')
+            else:
+                profiler = Profiler()
+                profiler.start()
+                return profiler
+
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    except Exception:
+        _profile_lock.release()
+        raise
+
+
+# Останавливаем профилировщик; отчет сохраняется, только если вызов медленный
+def _finish_profiler(profiler, scope, elapsed):
+    try:
+        if hasattr(profiler, 'disable'):
+            profiler.disable()
+        else:
+            profiler.stop()
+
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms < PROFILE_SLOW_MS:
+            return
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base_path = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}_{scope}_{elapsed_ms:.0f}ms')
+        if hasattr(profiler, 'dump_stats'):
+            import pstats
+
+            profiler.dump_stats(base_path + '.prof')
+            with open(base_path + '.txt', 'w', encoding='utf-8') as f:
+                pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+            path = base_path + '.prof'
+        else:
+            path = base_path + '.html'
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+        logger.info('Медленный вызов %s (%.0f мс), профиль: %s', scope, elapsed_ms, path)
+    finally:
+        _profile_lock.release()
+
+
+# Декоратор колбэка или загрузчика: общее время (фаза total), исход вызова,
+# фазы внутри функции записываются на ее имя. При COVID_PROFILE_SLOW_MS
+# медленные вызовы профилируются
+def instrumented(name=None):
+    def decorator(func):
+        scope = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            previous_scope = getattr(_local, 'scope', None)
+            _local.scope = scope
+            profiler = _start_profiler()
+            status = 'ok'
+            started_at = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except PreventUpdate:
+                status = 'prevented'
+                raise
+            except Exception:
+                status = 'error'
+                raise
+            finally:
+                elapsed = time.perf_counter() - started_at
+                metrics.observe_phase(scope, 'total', elapsed)
+                metrics.count_call(scope, status)
+                if profiler is not None:
+                    _finish_profiler(profiler, scope, elapsed)
+                _local.scope = previous_scope
+
+                # Для after_request: какой колбэк обслужил запрос и когда он закончил
+                if flask.has_request_context():
+                    flask.g.covid_callback = scope
+                    flask.g.covid_callback_finished = time.perf_counter()
+        return wrapper
+    return decorator
+
+
+# Подключение к Flask-серверу Dash: фаза serialize (от возврата из колбэка
+# до готового ответа - кодирование JSON в Dash и сжатие), размер ответа и /metrics.
+# extra() возвращает дополнительные метрики: (имя, тип, описание, [(метки, значение)])
+def install(server, extra=None):
+    @server.after_request
+    def record_response(response):
+        scope = flask.g.get('covid_callback')
+        if scope is not None and flask.request.path.endswith('_dash-update-component'):
+            metrics.observe_phase(scope, 'serialize', time.perf_counter() - flask.g.covid_callback_finished)
+            if not response.is_streamed:
+                metrics.observe_payload(scope, response.calculate_content_length() or 0,
+                                        response.headers.get('Content-Encoding', 'identity'))
+        return response
+
+    @server.route('/metrics')
+    def prometheus_metrics():
+        body = metrics.render(extra() if extra is not None else ())
+        return flask.Response(body, mimetype='text/plain; version=0.0.4; charset=utf-8')
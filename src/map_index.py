@@ -0,0 +1,295 @@
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from schema import DAY_COLUMN, day_to_timestamp
+
+
+# Колонки кадра карты на одну дату. Подписи при наведении в кадр
+# не входят: их собирает браузер по шаблону (см. MAP_HOVER_TEMPLATE)
+MAP_COLUMNS = ['name', 'confirmed_per_100k', 'deaths_per_100k', 'longitude', 'latitude',
+               'country_color', 'size_value', 'marker_size']
+
+
+# Генерируем уникальные цвета для каждой страны
+def generate_country_colors(country_names):
+    # Палитры импортируются здесь, а не при старте модуля
+    from plotly.colors import qualitative
+
+    colors = {}
+    # Используем цветовую палитру Plotly
+    base_colors = qualitative.Set1 + qualitative.Set2 + qualitative.Set3 + qualitative.Pastel1 + qualitative.Pastel2
+
+    for i, country in enumerate(country_names):
+        # Циклически используем цвета из палитры
+        color_idx = i % len(base_colors)
+        colors[country] = base_colors[color_idx]
+
+    return colors
+
+
+# Страны карты: название, координаты и цвет - по одной строке на страну
+# (страны без координат на карту не попадают). Строки таблицы карты
+# ссылаются на них кодом категории названия
+def build_map_countries(coord_df, country_colors):
+    coords = coord_df.drop_duplicates('name').dropna(subset=['longitude', 'latitude'])
+    names = coords['name'].to_numpy(dtype=str)
+    return pd.DataFrame({
+        'name': names,
+        'longitude': coords['longitude'].to_numpy(),
+        'latitude': coords['latitude'].to_numpy(),
+        'country_color': pd.Series(names).map(country_colors).fillna('#808080').to_numpy(),
+    })
+
+
+# Таблица карты за все даты: день, название страны (категория с порядком
+# стран из build_map_countries) и значения на 100 тысяч; строки
+# отсортированы по дню. Координаты, цвет и размер кругов в строках не
+# хранятся - кадр собирает их по коду страны (см. map_frame). Строится
+# один раз при загрузке (под gunicorn - в мастер-процессе, см.
+# data_loader.prepare_datasets)
+def build_map_table(daily_stats_df, countries):
+    names = pd.Categorical(daily_stats_df['name'])
+    positions = pd.Index(countries['name'].astype(str)).get_indexer(names.categories.astype(str))
+    codes = np.where(names.codes >= 0, positions[names.codes], -1)
+
+    # Удаляем страны без координат
+    keep = codes >= 0
+    map_table = pd.DataFrame({
+        DAY_COLUMN: daily_stats_df[DAY_COLUMN].to_numpy()[keep],
+        'name': pd.Categorical.from_codes(codes[keep], categories=countries['name'].astype(str)),
+        'confirmed_per_100k': daily_stats_df['confirmed_per_100k'].to_numpy()[keep],
+        'deaths_per_100k': daily_stats_df['deaths_per_100k'].to_numpy()[keep],
+    })
+
+    # Стабильная сортировка сохраняет исходный порядок стран внутри дня
+    return map_table.sort_values(DAY_COLUMN, kind='stable').reset_index(drop=True)
+
+
+# Свойства стран массивами numpy: кадры карты выбирают из них по кодам
+def country_arrays(countries):
+    return {
+        'name': countries['name'].to_numpy(dtype=object),
+        'longitude': countries['longitude'].to_numpy(),
+        'latitude': countries['latitude'].to_numpy(),
+        'country_color': countries['country_color'].to_numpy(dtype=object),
+    }
+
+
+# Кадр карты с колонками MAP_COLUMNS: значения - из строк дня таблицы
+# карты, координаты и цвет - из массивов стран по коду названия
+def map_frame(rows, arrays):
+    codes = rows['name'].array.codes
+    confirmed = rows['confirmed_per_100k'].to_numpy()
+    size_value = np.nan_to_num(confirmed, nan=0) + 1
+    return pd.DataFrame({
+        'name': arrays['name'][codes],
+        'confirmed_per_100k': confirmed,
+        'deaths_per_100k': rows['deaths_per_100k'].to_numpy(),
+        'longitude': arrays['longitude'][codes],
+        'latitude': arrays['latitude'][codes],
+        'country_color': arrays['country_color'][codes],
+        'size_value': size_value,
+        # Ограничиваем размер кругов
+        'marker_size': np.clip(size_value, 5, 50),
+    })
+
+
+# Индекс «дата -> кадр карты»: строки дня - срезы таблицы карты по
+# смещениям дней, данные не копируются. Колбэку карты остается только
+# найти строки по ключу, без фильтрации всей таблицы и без merge.
+# Срез дня создается при первом обращении к дате: при загрузке
+# считаются только смещения
+def index_map_table(map_table, countries):
+    if map_table.empty:
+        return DateIndex(countries=countries)
+    days = map_table[DAY_COLUMN].to_numpy()
+    bounds = np.flatnonzero(np.diff(days)) + 1
+    starts = np.concatenate([[0], bounds])
+    stops = np.concatenate([bounds, [len(days)]])
+    return DateIndex({
+        day_to_timestamp(days[start]): (map_table, start, stop)
+        for start, stop in zip(starts.tolist(), stops.tolist())
+    }, countries)
+
+
+def build_date_index(daily_stats_df, countries):
+    return index_map_table(build_map_table(daily_stats_df, countries), countries)
+
+
+# Индекс «дата -> кадр карты», который дописывается новыми датами.
+# Индексы разных версий данных делят список дат и словарь позиций: новые
+# даты добавляются в конец без копирования, а каждый индекс видит только
+# свои первые size дат. Читатели не перебирают общий словарь, поэтому
+# дописывание не мешает колбэкам, которые держат старую версию.
+# Хранятся строки дней таблицы карты (или смещения дня в таблице, пока
+# к дате не обращались), кадр собирается при обращении
+class DateIndex(Mapping):
+    def __init__(self, rows=None, countries=None, _shared=None, _size=None):
+        if _shared is None:
+            dates = sorted(rows or {})
+            _shared = {'dates': dates, 'rows': [rows[date] for date in dates],
+                       'positions': {date: i for i, date in enumerate(dates)},
+                       'lock': threading.Lock()}
+            _size = len(dates)
+        self.countries = countries
+        self._arrays = country_arrays(countries) if countries is not None else None
+        self._shared = _shared
+        self._size = _size
+
+    # Строки таблицы карты за дату (без координат и цветов). Срез по
+    # смещениям запоминается в общем списке: повторно он не создается
+    def rows(self, date):
+        position = self._shared['positions'].get(date)
+        if position is None or position >= self._size:
+            raise KeyError(date)
+        rows = self._shared['rows'][position]
+        if isinstance(rows, tuple):
+            table, start, stop = rows
+            rows = table.iloc[start:stop].reset_index(drop=True)
+            self._shared['rows'][position] = rows
+        return rows
+
+    def __getitem__(self, date):
+        return map_frame(self.rows(date), self._arrays)
+
+    def __iter__(self):
+        return iter(self._shared['dates'][:self._size])
+
+    def __len__(self):
+        return self._size
+
+    # Индекс с добавленными датами другого индекса (по тем же странам).
+    # Если все новые даты позже последней и общие списки еще никто
+    # не продолжал, они дописываются на месте; иначе индекс собирается
+    # заново. Строки за уже известную дату (страны, приславшие данные
+    # позже) добавляются к строкам этой даты
+    def extended(self, other):
+        shared = self._shared
+        new_dates = sorted(other)
+        with shared['lock']:
+            dates = shared['dates']
+            if (len(dates) == self._size
+                    and (not new_dates or not dates or new_dates[0] > dates[self._size - 1])):
+                for date in new_dates:
+                    shared['positions'][date] = len(dates)
+                    shared['rows'].append(other.rows(date))
+                    dates.append(date)
+                return DateIndex(countries=self.countries, _shared=shared, _size=len(dates))
+        rows = {date: self.rows(date) for date in self}
+        for date in new_dates:
+            if date in rows:
+                rows[date] = pd.concat([rows[date], other.rows(date)], ignore_index=True)
+            else:
+                rows[date] = other.rows(date)
+        return DateIndex(rows, self.countries)
+
+
+# Подпись при наведении: название страны берется из text, значения -
+# из customdata. Шаблон один на trace, а не строка на каждую страну
+MAP_HOVER_TEMPLATE = ('%{text}<br>Случаев на 100к: %{customdata[0]:.2f}'
+                      '<br>Смертей на 100к: %{customdata[1]:.2f}<extra></extra>')
+
+
+# Пустой кадр на случай даты без данных
+def empty_map_frame():
+    return pd.DataFrame(columns=MAP_COLUMNS)
+
+
+def lookup_date(date_index, date):
+    frame = date_index.get(pd.Timestamp(date))
+    if frame is None:
+        return empty_map_frame()
+    return frame
+
+
+# Массивы, которые меняются от даты к дате: координаты, размеры, цвета,
+# названия и значения для подписи (столбцы «случаи, смерти» на 100 тысяч)
+def map_trace_arrays(map_data):
+    return {
+        'lon': map_data['longitude'].to_numpy(dtype='float32'),
+        'lat': map_data['latitude'].to_numpy(dtype='float32'),
+        'size': map_data['marker_size'].to_numpy(dtype='float32'),  # Размер уже ограничен в кадре
+        'color': map_data['country_color'].to_numpy(),
+        'text': map_data['name'].to_numpy(dtype=object),
+        'customdata': np.column_stack([map_data['confirmed_per_100k'].to_numpy(dtype='float32'),
+                                       map_data['deaths_per_100k'].to_numpy(dtype='float32')])
+    }
+
+
+# Один trace карты для всех стран: все свойства передаются массивами.
+# Trace - обычный словарь: проверка свойств plotly на каждый ответ не нужна
+def map_trace(map_data):
+    arrays = map_trace_arrays(map_data)
+    return {
+        'type': 'scattergeo',
+        'lon': arrays['lon'],
+        'lat': arrays['lat'],
+        'mode': 'markers',
+        'marker': {
+            'size': arrays['size'],
+            'color': arrays['color'],
+            'opacity': 0.8,
+            'line': {'width': 1, 'color': 'darkgray'},
+            'sizemode': 'area'
+        },
+        'text': arrays['text'],
+        'customdata': arrays['customdata'],
+        'hovertemplate': MAP_HOVER_TEMPLATE,
+        'showlegend': False  # Не показывать в легенде Plotly, так как у нас своя
+    }
+
+
+# Строки таблицы-легенды: цветной маркер, страна, случаи на 100к
+def legend_rows(map_data):
+    markers = np.char.add(np.char.add("<span style='color:", map_data['country_color'].to_numpy(dtype=str)),
+                          ";font-size:18px'>●</span>")
+    confirmed = _json_values(map_data['confirmed_per_100k'].to_numpy(dtype=float), digits=1)
+    return [
+        {'marker': marker, 'name': name, 'confirmed': value}
+        for marker, name, value in zip(markers.tolist(), map_data['name'], confirmed)
+    ]
+
+
+def _json_values(values, digits=3):
+    return [None if np.isnan(v) else round(float(v), digits) for v in values]
+
+
+# Компактные данные карты за все даты для отрисовки в браузере:
+# список стран (название, координаты, цвет) один раз, а для каждой даты -
+# номера присутствующих стран и их значения на 100 тысяч
+def build_client_payload(date_index, base_layout, version):
+    table = country_arrays(date_index.countries)
+
+    countries = {}
+    names, lon, lat, colors = [], [], [], []
+    dates, rows = [], []
+
+    for date in sorted(date_index):
+        frame = date_index.rows(date)
+        positions = []
+        for code in frame['name'].array.codes.tolist():
+            if code not in countries:
+                countries[code] = len(names)
+                names.append(table['name'][code])
+                lon.append(round(float(table['longitude'][code]), 4))
+                lat.append(round(float(table['latitude'][code]), 4))
+                colors.append(table['country_color'][code])
+            positions.append(countries[code])
+
+        dates.append(date.strftime('%Y-%m-%d'))
+        rows.append({
+            'i': positions,
+            'c': _json_values(frame['confirmed_per_100k'].to_numpy(dtype=float)),
+            'd': _json_values(frame['deaths_per_100k'].to_numpy(dtype=float))
+        })
+
+    return {
+        'version': version,
+        'layout': base_layout,
+        'countries': {'name': names, 'lon': lon, 'lat': lat, 'color': colors},
+        'dates': dates,
+        'rows': rows
+    }
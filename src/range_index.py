@@ -0,0 +1,252 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from map_index import MAP_COLUMNS, empty_map_frame
+from schema import DAY_COLUMN, dates_to_days
+
+
+# Показатели карты, по которым строятся агрегаты за период
+RANGE_METRICS = ['confirmed_per_100k', 'deaths_per_100k']
+
+# Виды агрегатов: сумма, среднее по дням с данными, максимум (пик)
+RANGE_AGGREGATIONS = ('sum', 'mean', 'max')
+
+# Префикс имен массивов индекса среди опубликованных наборов данных (см. to_arrays)
+ARRAY_PREFIX = 'range_index.'
+
+
+# Плотная матрица «страна x день» одного показателя; пропуски - NaN
+def _dense_values(df, column, country_positions, first_day, n_days, n_countries):
+    values = np.full((n_countries, n_days), np.nan)
+    rows = country_positions[df['name'].astype(str)].to_numpy()
+    cols = df[DAY_COLUMN].to_numpy() - first_day
+    values[rows, cols] = df[column].to_numpy(dtype='float64')
+    return values
+
+
+def _prefix(values):
+    filled = np.nan_to_num(values, nan=0.0)
+    sums = np.concatenate([np.zeros((len(values), 1)), np.cumsum(filled, axis=1)], axis=1)
+    counts = np.concatenate([np.zeros((len(values), 1), dtype='int32'),
+                             np.cumsum(~np.isnan(values), axis=1, dtype='int32')], axis=1)
+    return sums, counts
+
+
+# Нулевой уровень таблицы максимумов: пропуски не должны побеждать в max
+def _max_base(values):
+    return np.where(np.isnan(values), -np.inf, values).astype('float32')
+
+
+# Уровни разреженной таблицы: levels[k][:, i] - максимум за дни [i, i + 2^k)
+def _sparse_levels(base):
+    n_days = base.shape[1]
+
+    levels = [base]
+    k = 1
+    while (1 << k) <= n_days:
+        half = 1 << (k - 1)
+        prev = levels[-1]
+        width = n_days - (1 << k) + 1
+        levels.append(np.maximum(prev[:, :width], prev[:, half:width + half]))
+        k += 1
+    return levels
+
+
+# Столбцы «день» с запасом емкости. Индексы разных версий делят один буфер:
+# каждый читает только свои первые столбцы, новые дни дописываются за ними.
+# Пока емкости хватает, уже посчитанные столбцы не копируются; когда не
+# хватает, емкость удваивается. Массивы в разделяемой памяти доступны
+# только для чтения - первое дописывание переносит их в новый буфер
+class _ColumnBuffer:
+    def __init__(self, array, size=None):
+        self.array = array
+        self.size = array.shape[1] if size is None else size
+        self._lock = threading.Lock()
+
+    # Буфер с первыми size столбцами и дописанным хвостом. Дописать на месте
+    # можно, только если буфер после size еще никто не продолжал
+    def appended(self, size, tail):
+        end = size + tail.shape[1]
+        with self._lock:
+            if size == self.size and end <= self.array.shape[1] and self.array.flags.writeable:
+                self.array[:, size:end] = tail
+                self.size = end
+                return self
+
+        array = np.empty((self.array.shape[0], max(2 * end, 1)), dtype=self.array.dtype)
+        array[:, :size] = self.array[:, :size]
+        array[:, size:end] = tail
+        return _ColumnBuffer(array, end)
+
+
+# Уровни разреженной таблицы для ряда из old_days дней, продолженного днями
+# base: у каждого уровня досчитываются только новые позиции
+def _extended_levels(levels, old_days, base):
+    n_days = old_days + base.shape[1]
+
+    new_levels = [levels[0].appended(old_days, base)]
+    k = 1
+    while (1 << k) <= n_days:
+        half = 1 << (k - 1)
+        prev = new_levels[-1].array
+        width = n_days - (1 << k) + 1
+        done = max(old_days - (1 << k) + 1, 0)
+        tail = np.maximum(prev[:, done:width], prev[:, done + half:width + half])
+        if k < len(levels):
+            new_levels.append(levels[k].appended(done, tail))
+        else:
+            new_levels.append(_ColumnBuffer(tail))
+        k += 1
+    return new_levels
+
+
+# Индекс агрегатов карты за произвольный период. Для каждой страны
+# хранятся префиксные суммы (сумма и среднее) и разреженная таблица
+# максимумов (пик), поэтому запрос стоит O(число стран) при любой длине
+# периода. Статические свойства стран (координаты, цвет) - в countries.
+class RangeIndex:
+    def __init__(self, daily_stats_df, coord_df, country_colors):
+        names = pd.Index(daily_stats_df['name'].astype(str).unique())
+        coords = coord_df.drop_duplicates('name').set_index('name')
+        names = names[names.isin(coords.index)]
+        coords = coords.loc[names].dropna(subset=['longitude', 'latitude'])
+
+        self.countries = pd.DataFrame({
+            'name': coords.index.to_numpy(dtype=str),
+            'longitude': coords['longitude'].to_numpy(),
+            'latitude': coords['latitude'].to_numpy(),
+        })
+        self.countries['country_color'] = self.countries['name'].map(country_colors).fillna('#808080')
+        self._positions = pd.Series(np.arange(len(self.countries)), index=self.countries['name'])
+
+        df = daily_stats_df[daily_stats_df['name'].astype(str).isin(self._positions.index)]
+        self.first_day = int(daily_stats_df[DAY_COLUMN].min())
+        self.n_days = int(daily_stats_df[DAY_COLUMN].max()) - self.first_day + 1
+
+        self._sums, self._counts, self._levels = {}, {}, {}
+        for metric in RANGE_METRICS:
+            values = _dense_values(df, metric, self._positions, self.first_day, self.n_days, len(self.countries))
+            sums, counts = _prefix(values)
+            self._sums[metric], self._counts[metric] = _ColumnBuffer(sums), _ColumnBuffer(counts)
+            self._levels[metric] = [_ColumnBuffer(level) for level in _sparse_levels(_max_base(values))]
+
+    # Массивы индекса под именами с ARRAY_PREFIX: их публикует мастер-процесс
+    # вместе с наборами данных (см. data_loader.prepare_datasets)
+    def to_arrays(self):
+        arrays = {ARRAY_PREFIX + 'countries': self.countries}
+        for metric in RANGE_METRICS:
+            arrays[f'{ARRAY_PREFIX}sums.{metric}'] = self._sums[metric].array[:, :self.n_days + 1]
+            arrays[f'{ARRAY_PREFIX}counts.{metric}'] = self._counts[metric].array[:, :self.n_days + 1]
+            for k, level in enumerate(self._levels[metric]):
+                arrays[f'{ARRAY_PREFIX}levels.{metric}.{k}'] = level.array[:, :self.n_days - (1 << k) + 1]
+        return arrays
+
+    # Индекс поверх готовых массивов (например, в разделяемой памяти) без пересчета
+    @classmethod
+    def from_arrays(cls, arrays, first_day):
+        index = cls.__new__(cls)
+        countries = arrays[ARRAY_PREFIX + 'countries']
+        index.countries = countries.assign(name=countries['name'].astype(str))
+        index._positions = pd.Series(np.arange(len(index.countries)), index=index.countries['name'])
+        index.first_day = int(first_day)
+
+        index._sums, index._counts, index._levels = {}, {}, {}
+        for metric in RANGE_METRICS:
+            index._sums[metric] = _ColumnBuffer(arrays[f'{ARRAY_PREFIX}sums.{metric}'])
+            index._counts[metric] = _ColumnBuffer(arrays[f'{ARRAY_PREFIX}counts.{metric}'])
+            levels = []
+            while f'{ARRAY_PREFIX}levels.{metric}.{len(levels)}' in arrays:
+                levels.append(_ColumnBuffer(arrays[f'{ARRAY_PREFIX}levels.{metric}.{len(levels)}']))
+            index._levels[metric] = levels
+        index.n_days = index._sums[RANGE_METRICS[0]].size - 1
+        return index
+
+    # Новый индекс с добавленными днями: префиксы продолжаются от последнего
+    # значения, в разреженной таблице досчитываются только новые позиции.
+    # Новые столбцы дописываются в общие буферы (_ColumnBuffer), поэтому
+    # добавление стоит O(размер дельты), а не O(вся история); старый индекс
+    # продолжает читать свои столбцы. Дельта содержит дни после последнего
+    # и, возможно, строки за сам последний день от стран, у которых его еще
+    # не было (данные, пришедшие позже). Тогда последний столбец
+    # пересчитывается, и буферы копируются: старый индекс читает прежний.
+    # Страны, которых не было при построении, в агрегаты за период
+    # не попадают до перезапуска
+    def extended(self, delta):
+        index = RangeIndex.__new__(RangeIndex)
+        index.countries = self.countries
+        index._positions = self._positions
+        index.first_day = self.first_day
+
+        last_day = self.first_day + self.n_days - 1
+        delta = delta[delta['name'].astype(str).isin(self._positions.index) & (delta[DAY_COLUMN] >= last_day)]
+        late = not delta.empty and int(delta[DAY_COLUMN].min()) <= last_day
+        if not delta.empty:
+            last_day = max(last_day, int(delta[DAY_COLUMN].max()))
+        index.n_days = last_day - self.first_day + 1
+        # Первый пересчитываемый день: последний, если пришли строки за него
+        start = self.n_days - 1 if late else self.n_days
+
+        index._sums, index._counts, index._levels = {}, {}, {}
+        for metric in RANGE_METRICS:
+            values = _dense_values(delta, metric, self._positions, self.first_day + start,
+                                   index.n_days - start, len(self.countries))
+            old_sums, old_counts = self._sums[metric].array, self._counts[metric].array
+            if late:
+                # Значение за последний день уже есть - повтор не учитываем
+                known = old_counts[:, self.n_days] > old_counts[:, self.n_days - 1]
+                values[known, 0] = np.nan
+            base = _max_base(values)
+            if late:
+                base[:, 0] = np.maximum(base[:, 0], self._levels[metric][0].array[:, start])
+
+            # Префиксы от последнего значения: при строках за последний день
+            # перезаписывается и столбец «итог по последний день»
+            sums, counts = _prefix(values)
+            last = slice(self.n_days, self.n_days + 1)
+            index._sums[metric] = self._sums[metric].appended(start + 1, old_sums[:, last] + sums[:, 1:])
+            index._counts[metric] = self._counts[metric].appended(start + 1, old_counts[:, last] + counts[:, 1:])
+            index._levels[metric] = _extended_levels(self._levels[metric], start, base)
+        return index
+
+    def _clip(self, start, end):
+        lo = max(int(dates_to_days([start])[0]) - self.first_day, 0)
+        hi = min(int(dates_to_days([end])[0]) - self.first_day, self.n_days - 1)
+        return lo, hi
+
+    # Агрегат показателя за дни [lo, hi] по всем странам и число дней с данными
+    def _aggregate(self, metric, aggregation, lo, hi):
+        counts = self._counts[metric].array[:, hi + 1] - self._counts[metric].array[:, lo]
+        sums = self._sums[metric].array[:, hi + 1] - self._sums[metric].array[:, lo]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if aggregation == 'sum':
+                result = sums
+            elif aggregation == 'mean':
+                result = sums / counts
+            else:
+                k = int(np.log2(hi - lo + 1))
+                level = self._levels[metric][k].array
+                result = np.maximum(level[:, lo], level[:, hi - (1 << k) + 1]).astype('float64')
+        return np.where(counts > 0, result, np.nan), counts
+
+    # Кадр карты за период с теми же колонками, что и кадры date_index:
+    # агрегаты стоят на месте дневных значений. Страны без данных за период не попадают
+    def query(self, start, end, aggregation='sum'):
+        if aggregation not in RANGE_AGGREGATIONS:
+            raise ValueError(f'Неизвестный агрегат: {aggregation}')
+
+        lo, hi = self._clip(start, end)
+        if lo > hi:
+            return empty_map_frame()
+
+        map_data = self.countries.copy()
+        has_data = np.zeros(len(map_data), dtype=bool)
+        for metric in RANGE_METRICS:
+            map_data[metric], counts = self._aggregate(metric, aggregation, lo, hi)
+            has_data |= counts > 0
+
+        map_data = map_data[has_data].reset_index(drop=True)
+        map_data['size_value'] = map_data['confirmed_per_100k'].fillna(0) + 1
+        map_data['marker_size'] = np.clip(map_data['size_value'].to_numpy(), 5, 50)
+        return map_data[MAP_COLUMNS]
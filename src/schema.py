@@ -0,0 +1,75 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+# Дата наблюдения хранится как число дней от 1970-01-01 (int32)
+DATE_COLUMN = 'observed_date'
+DAY_COLUMN = 'observed_day'
+
+
+def dates_to_days(dates):
+    return np.asarray(pd.to_datetime(dates), dtype='datetime64[D]').astype('int32')
+
+
+def days_to_dates(days):
+    return np.asarray(days, dtype='int64').astype('datetime64[D]').astype('datetime64[ns]')
+
+
+def day_to_timestamp(day):
+    return pd.Timestamp(np.datetime64(int(day), 'D'))
+
+
+# Вещественные колонки - в float32, целые - в минимально достаточный тип.
+# Колонка из целых значений (население, счетчики, которые база отдает как
+# float) переводится в float32, только если значения не меняются: float32
+# точно хранит целые числа лишь до 2^24
+def _downcast_numeric(df, exclude=()):
+    for col in df.columns:
+        if col in exclude:
+            continue
+        if pd.api.types.is_float_dtype(df[col]):
+            values = df[col].to_numpy(dtype='float64')
+            compact = values.astype('float32')
+            whole = np.isnan(values) | (values == np.round(values))
+            if whole.all() and not np.array_equal(compact, values, equal_nan=True):
+                continue
+            df[col] = compact
+        elif pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+# Ежедневная статистика: названия стран - категории, даты - дни int32
+def compact_daily_stats(daily_stats_df):
+    df = daily_stats_df.copy()
+    df['name'] = df['name'].str.strip().astype('category')
+    df[DAY_COLUMN] = dates_to_days(df[DATE_COLUMN])
+    df = df.drop(columns=[DATE_COLUMN])
+    return _downcast_numeric(df, exclude=(DAY_COLUMN,))
+
+
+def compact_coords(coord_df):
+    df = coord_df.copy()
+    df['name'] = df['name'].str.strip()
+    return _downcast_numeric(df)
+
+
+# id страны оставляем как есть: по нему идут запросы к базе и поиск рисков.
+# Население тоже: его показывает таблица страны, и оно должно быть точным
+def compact_countries(df_countries):
+    return _downcast_numeric(df_countries.copy(), exclude=('id', 'population'))
+
+
+# Объём памяти каждого набора данных (с учётом строк), пишется в лог при старте.
+# Наборы - кадры и массивы numpy (см. data_loader.prepare_datasets)
+def memory_report(frames):
+    report = {name: int(df.nbytes if isinstance(df, np.ndarray) else df.memory_usage(deep=True).sum())
+              for name, df in frames.items()}
+    for name, nbytes in report.items():
+        logger.info('%s: %d строк, %.2f МБ', name, len(frames[name]), nbytes / 2 ** 20)
+    logger.info('Всего: %.2f МБ', sum(report.values()) / 2 ** 20)
+    return report
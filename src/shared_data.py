@@ -0,0 +1,124 @@
+import json
+import os
+import uuid
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+# Переменная окружения с путем к манифесту опубликованных наборов данных.
+# Ее выставляет мастер-процесс gunicorn (см. gunicorn.conf.py), воркеры
+# наследуют ее и подключаются к данным без копирования.
+MANIFEST_ENV = 'COVID_SHARED_MANIFEST'
+
+# Открытые сегменты разделяемой памяти: пока они живы, живут и массивы
+_segments = []
+
+
+def _create_segment(array):
+    array = np.ascontiguousarray(array)
+    segment = shared_memory.SharedMemory(
+        name=f'covid_{uuid.uuid4().hex[:16]}', create=True, size=max(array.nbytes, 1)
+    )
+    np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+    _segments.append(segment)
+    return segment.name
+
+
+def _attach_segment(name, dtype, shape):
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        # До Python 3.13 подключение регистрирует сегмент в resource_tracker,
+        # и тот удалил бы его при выходе воркера - снимаем регистрацию
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    except Exception:
+        pass
+    _segments.append(segment)
+    return np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=segment.buf)
+
+
+# Публикуем кадр: числовые колонки копируются в разделяемую память,
+# строковые и категориальные - как коды категорий плюс список категорий
+def publish_frame(df):
+    columns = []
+    for col in df.columns:
+        values = df[col]
+        entry = {'name': col}
+        if isinstance(values.dtype, pd.CategoricalDtype) or not pd.api.types.is_numeric_dtype(values):
+            categorical = values.astype('category')
+            entry['categories'] = [str(c) for c in categorical.cat.categories]
+            values = categorical.cat.codes
+        array = values.to_numpy()
+        entry.update(segment=_create_segment(array), dtype=array.dtype.str, length=len(array))
+        columns.append(entry)
+
+    index = df.index.name if df.index.name in df.columns else None
+    return {'columns': columns, 'index': index, 'length': len(df)}
+
+
+# Подключаемся к опубликованному кадру: числовые колонки - это представления
+# поверх разделяемой памяти, данные не копируются
+def attach_frame(meta):
+    data = {}
+    for entry in meta['columns']:
+        array = _attach_segment(entry['segment'], entry['dtype'], (entry['length'],))
+        array.flags.writeable = False
+        if 'categories' in entry:
+            data[entry['name']] = pd.Categorical.from_codes(array, entry['categories'])
+        else:
+            data[entry['name']] = array
+
+    df = pd.DataFrame(data, copy=False)
+    if meta['index'] is not None:
+        df = df.set_index(meta['index'], drop=False)
+    return df
+
+
+# Публикуем массив (например, префиксные суммы RangeIndex) целиком
+def publish_array(array):
+    return {'segment': _create_segment(array), 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+
+def attach_array(meta):
+    array = _attach_segment(meta['segment'], meta['dtype'], meta['shape'])
+    array.flags.writeable = False
+    return array
+
+
+# Наборы данных - кадры и массивы numpy (см. data_loader.prepare_datasets)
+def publish_datasets(frames, manifest_path):
+    manifest = {
+        name: publish_frame(value) if isinstance(value, pd.DataFrame) else publish_array(value)
+        for name, value in frames.items()
+    }
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+    os.environ[MANIFEST_ENV] = manifest_path
+    return manifest
+
+
+# Наборы данных из манифеста или None, если предзагрузка не включена
+def attach_datasets():
+    manifest_path = os.environ.get(MANIFEST_ENV)
+    if not manifest_path or not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    return {name: attach_array(meta) if 'shape' in meta else attach_frame(meta)
+            for name, meta in manifest.items()}
+
+
+# Освобождаем сегменты (вызывается мастер-процессом при остановке)
+def release_datasets(unlink=False):
+    while _segments:
+        segment = _segments.pop()
+        segment.close()
+        if unlink:
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
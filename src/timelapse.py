@@ -0,0 +1,115 @@
+import math
+
+import plotly.graph_objects as go
+
+from map_index import map_trace, map_trace_arrays
+
+
+# Значения по умолчанию для элементов управления анимацией
+TIMELAPSE_DEFAULT_STRIDE = 7
+TIMELAPSE_DEFAULT_MAX_FRAMES = 60
+TIMELAPSE_FRAME_DURATION_MS = 300
+
+# Верхние границы полей анимации: каждый кадр - полный набор массивов
+# карты, поэтому число кадров ограничивает размер ответа и время сборки.
+# Шаг больше года дает один-два кадра, дальше он ничего не меняет
+TIMELAPSE_MAX_FRAMES_LIMIT = 200
+TIMELAPSE_MAX_STRIDE = 365
+
+
+# Шаг и число кадров в допустимых пределах: значения приходят из полей ввода
+def clamp_timelapse_options(stride, max_frames):
+    stride = min(max(1, int(stride)), TIMELAPSE_MAX_STRIDE)
+    max_frames = min(max(1, int(max_frames)), TIMELAPSE_MAX_FRAMES_LIMIT)
+    return stride, max_frames
+
+
+# Выбираем даты кадров: каждый stride-й день, но не больше max_frames кадров.
+# Если кадров слишком много, шаг увеличивается; последняя дата всегда входит.
+def select_frame_dates(dates, stride, max_frames):
+    dates = sorted(dates)
+    if not dates:
+        return []
+
+    stride, max_frames = clamp_timelapse_options(stride, max_frames)
+    stride = max(stride, math.ceil(len(dates) / max_frames))
+
+    frame_dates = dates[::stride]
+    if frame_dates[-1] != dates[-1]:
+        if len(frame_dates) < max_frames:
+            frame_dates.append(dates[-1])
+        else:
+            frame_dates[-1] = dates[-1]
+    return frame_dates
+
+
+# Кадр содержит только меняющиеся массивы; оформление trace
+# (прозрачность, обводка, режим размера) берётся из базового trace
+def _frame_data(map_data):
+    arrays = map_trace_arrays(map_data)
+    return dict(
+        type='scattergeo',
+        lon=arrays['lon'],
+        lat=arrays['lat'],
+        marker=dict(size=arrays['size'], color=arrays['color']),
+        text=arrays['text'],
+        customdata=arrays['customdata']
+    )
+
+
+def _frame_title(date):
+    return f'Распространение COVID-19 на {date.strftime("%d.%m.%Y")}'
+
+
+# Анимированная карта по датам из индекса date_index
+def build_timelapse_figure(date_index, frame_dates):
+    frames = []
+    slider_steps = []
+    for date in frame_dates:
+        label = date.strftime('%d.%m.%Y')
+        frames.append(go.Frame(
+            name=label,
+            data=[_frame_data(date_index[date])],
+            layout=dict(title=dict(text=_frame_title(date)))
+        ))
+        slider_steps.append(dict(
+            label=label,
+            method='animate',
+            args=[[label], dict(mode='immediate', frame=dict(duration=0, redraw=True),
+                                transition=dict(duration=0))]
+        ))
+
+    fig = go.Figure(data=[map_trace(date_index[frame_dates[0]])], frames=frames)
+    fig.update_layout(
+        title=dict(text=_frame_title(frame_dates[0])),
+        updatemenus=[dict(
+            type='buttons',
+            direction='left',
+            x=0.02,
+            y=0,
+            xanchor='left',
+            yanchor='top',
+            pad=dict(t=40),
+            showactive=False,
+            buttons=[
+                dict(label='▶', method='animate',
+                     args=[None, dict(fromcurrent=True,
+                                      frame=dict(duration=TIMELAPSE_FRAME_DURATION_MS, redraw=True),
+                                      transition=dict(duration=0))]),
+                dict(label='❚❚', method='animate',
+                     args=[[None], dict(mode='immediate', frame=dict(duration=0, redraw=False),
+                                        transition=dict(duration=0))])
+            ]
+        )],
+        sliders=[dict(
+            active=0,
+            x=0.1,
+            len=0.88,
+            y=0,
+            yanchor='top',
+            pad=dict(t=30),
+            currentvalue=dict(prefix='Дата: '),
+            steps=slider_steps
+        )]
+    )
+    return fig
@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import flask
+
+from instrumentation import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Ответы меньше этого размера не сжимаются: выигрыш меньше накладных расходов
+COMPRESS_MIN_BYTES = int(os.environ.get('COVID_COMPRESS_MIN_BYTES', '1024'))
+
+# Уровень gzip и качество brotli: средние значения - почти вся экономия
+# объема за небольшую долю процессорного времени максимальных
+GZIP_LEVEL = int(os.environ.get('COVID_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('COVID_BROTLI_QUALITY', '5'))
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/')
+
+# Сжатые статические файлы (бандлы компонентов Dash неизменны для одного
+# пути с отпечатком версии), чтобы не сжимать мегабайты на каждого клиента
+STATIC_CACHE_ENTRIES = 64
+
+
+def _encoding(accept_encoding):
+    accepted = {item.split(';')[0].strip().lower() for item in accept_encoding.split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _compressible(response):
+    return (response.status_code == 200
+            and not response.direct_passthrough
+            and not response.is_streamed
+            and 'Content-Encoding' not in response.headers
+            and response.mimetype.startswith(COMPRESSIBLE_TYPES))
+
+
+# Подключение к Flask-серверу Dash: сжатие ответов (gzip, или brotli,
+# если установлен пакет brotli) и ETag для ответов etag_paths, тело которых
+# не меняется между запросами (layout, dependencies): повторный запрос
+# получает 304. У этих адресов нет отпечатка версии, поэтому ответ
+# помечается no-cache - браузер проверяет тег, а не хранит ответ вслепую.
+# Бандлы компонентов (static_prefixes) адресуются с отпечатком версии,
+# и Dash сам отдает их с max-age на год: заголовки кэширования у них не
+# меняются, только тело сжимается и кэшируется в сжатом виде.
+# Вызывается после instrumentation.install, чтобы в метрики попал размер
+# сжатого ответа
+def install(server, etag_paths=(), static_prefixes=()):
+    etag_paths = set(etag_paths)
+    static_cache = OrderedDict()
+    static_lock = threading.Lock()
+
+    def cached_compress(data, encoding):
+        key = (flask.request.path, encoding)
+        with static_lock:
+            compressed = static_cache.get(key)
+            if compressed is not None:
+                static_cache.move_to_end(key)
+                return compressed
+        compressed = _compress(data, encoding)
+        with static_lock:
+            static_cache[key] = compressed
+            while len(static_cache) > STATIC_CACHE_ENTRIES:
+                static_cache.popitem(last=False)
+        return compressed
+
+    @server.after_request
+    def compress_response(response):
+        request = flask.request
+        if request.method != 'GET' and not request.path.endswith('_dash-update-component'):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        etag = None
+        if request.method == 'GET' and request.path in etag_paths and response.status_code == 200:
+            # Тег считается по несжатому телу; сжатые варианты - с суффиксом
+            etag = hashlib.md5(response.get_data()).hexdigest()
+            if any(request.if_none_match.contains(etag + suffix) for suffix in ('', '-gzip', '-br')):
+                not_modified = flask.Response(status=304)
+                not_modified.set_etag(etag)
+                not_modified.vary.add('Accept-Encoding')
+                not_modified.cache_control.no_cache = True
+                return not_modified
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+
+        if not _compressible(response):
+            return response
+        encoding = _encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+
+        started_at = time.perf_counter()
+        if request.path.startswith(static_prefixes):
+            compressed = cached_compress(data, encoding)
+        else:
+            compressed = _compress(data, encoding)
+        scope = flask.g.get('covid_callback')
+        if scope is not None:
+            metrics.observe_phase(scope, 'compress', time.perf_counter() - started_at)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if etag is not None:
+            response.set_etag(f'{etag}-{encoding}')
+        return response
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Модули приложения и заглушка окружения импортируются по имени, как в covid_app.py
+for path in (os.path.join(ROOT_DIR, 'src'), os.path.join(ROOT_DIR, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
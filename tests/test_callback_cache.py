@@ -0,0 +1,66 @@
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import callback_cache
+from callback_cache import CallbackCache, MemoryStore, SQLiteStore, create_callback_cache
+from data_loader import datasets_fingerprint
+
+
+def test_memory_entries_expire():
+    store = MemoryStore(ttl=0.05)
+    store.put('key', b'value')
+    assert store.get('key') == b'value'
+    time.sleep(0.06)
+    assert store.get('key') is None
+    assert store.stats()['expirations'] == 1
+    assert store.nbytes == 0
+
+
+def test_shared_entries_expire(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'cache.sqlite'), ttl=0.05)
+    store.put('key', b'value')
+    assert store.get('key') == b'value'
+    time.sleep(0.06)
+    assert store.get('key') is None
+
+
+def test_shared_cache_without_expiry_is_recreated(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE callback_cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                     'size INTEGER NOT NULL, accessed REAL NOT NULL)')
+        conn.execute("INSERT INTO callback_cache VALUES ('key', x'00', 1, 0)")
+
+    store = SQLiteStore(path)
+    assert store.get('key') is None
+    store.put('key', b'value')
+    assert store.get('key') == b'value'
+
+
+def test_ttl_is_capped(monkeypatch):
+    monkeypatch.setattr(callback_cache, 'SHARED_CACHE_PATH', None)
+    assert create_callback_cache(max_ttl=5).memory.ttl == 5
+    assert create_callback_cache().memory.ttl == callback_cache.TTL_SECONDS
+
+
+def test_version_includes_content():
+    calls = []
+    fingerprints = {'current': datasets_fingerprint(['a'], [pd.DataFrame({'x': [1.0, 2.0]})])}
+    cache = CallbackCache(memory=MemoryStore())
+
+    @cache.memoize(version=lambda: [fingerprints['current'], 2])
+    def compute(value):
+        calls.append(value)
+        return {'value': value}
+
+    compute(1)
+    compute(1)
+    assert calls == [1]
+
+    # Исправленные данные с тем же последним днем: другой отпечаток, новый расчет
+    fingerprints['current'] = datasets_fingerprint(['a'], [pd.DataFrame({'x': [1.0, np.nan]})])
+    compute(1)
+    assert calls == [1, 1]
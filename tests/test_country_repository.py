@@ -0,0 +1,123 @@
+import sqlite3
+import time
+
+import pandas as pd
+import pytest
+from sqlalchemy import event
+
+from country_repository import CountryRepository
+from data_loader import create_db_engine
+from standin import build_standin
+
+
+@pytest.fixture
+def standin(tmp_path):
+    env = build_standin(str(tmp_path), n_countries=8, n_days=10)
+    engine = create_db_engine(env['COVID_DB_URL'])
+    db_path = env['COVID_DB_URL'][len('sqlite:///'):]
+    with sqlite3.connect(db_path) as conn:
+        df_countries = pd.read_sql_query('SELECT * FROM countries', conn)
+
+    # Запросы к базе, которые выполнил репозиторий
+    queries = []
+    event.listen(engine, 'before_cursor_execute', lambda conn, cursor, statement, *args: queries.append(statement))
+    yield engine, db_path, df_countries, queries
+    engine.dispose()
+
+
+def execute(db_path, statement, params=()):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(statement, params)
+
+
+def wait_for_refresh(repository, timeout=5):
+    deadline = time.monotonic() + timeout
+    while repository._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not repository._refreshing
+
+
+def test_hits_are_served_from_memory(standin):
+    engine, _, df_countries, queries = standin
+    repository = CountryRepository(engine, df_countries)
+
+    country = repository.get_country('Country 002')
+    assert country['id'] == 3
+    assert repository.country_id('Country 002') == 3
+    assert queries == []
+
+    first = repository.get_disease_stats(3)
+    second = repository.get_disease_stats(3)
+    assert len(queries) == 1  # одна полная загрузка статистики
+    assert first is second
+    assert list(first.index) == ['diabetes', 'obesity', 'smoking', 'copd', 'cvd', 'hiv', 'hypertension']
+
+
+def test_misses_are_queried_once(standin):
+    engine, db_path, df_countries, queries = standin
+    execute(db_path, 'DELETE FROM disease_statistics WHERE country_id = 3')
+    repository = CountryRepository(engine, df_countries)
+
+    assert repository.get_disease_stats(3) is None
+    assert repository.get_disease_stats(3) is None
+    assert len(queries) == 2  # полная загрузка и один запрос по промаху
+
+    assert repository.get_country('Nowhere') is None
+    assert repository.get_country('Nowhere') is None
+    assert len(queries) == 3
+
+
+def test_batched_lookups(standin):
+    engine, db_path, df_countries, queries = standin
+    execute(db_path, 'DELETE FROM disease_statistics WHERE country_id = 3')
+    # В справочнике в памяти только часть стран: остальные догружаются одним запросом
+    repository = CountryRepository(engine, df_countries.head(4))
+
+    countries = repository.get_countries(['Country 006', 'Country 001', 'Nowhere', 'Country 005'])
+    assert list(countries['name']) == ['Country 006', 'Country 001', 'Country 005']
+    assert len(queries) == 1
+    repository.get_countries(['Country 006', 'Nowhere'])
+    assert len(queries) == 1
+
+    disease_df = repository.get_disease_stats_many([5, 3, 1, 5])
+    assert list(disease_df.index) == [5, 1]
+    assert len(queries) == 3  # полная загрузка и один запрос по промахам
+    repository.get_disease_stats_many([3, 1])
+    assert len(queries) == 3
+
+
+def test_ttl_refresh_runs_in_background(standin):
+    engine, db_path, df_countries, queries = standin
+    repository = CountryRepository(engine, df_countries, ttl=0)
+    old_value = repository.get_disease_stats(1)['diabetes']
+
+    execute(db_path, 'UPDATE disease_statistics SET diabetes = ? WHERE country_id = 1', (old_value + 1,))
+    # Устаревшие данные отдаются сразу, обновление идет в фоне
+    assert repository.get_disease_stats(1)['diabetes'] == old_value
+    wait_for_refresh(repository)
+    assert repository.get_disease_stats(1)['diabetes'] == old_value + 1
+
+
+def test_failed_refresh_keeps_stale_data(standin):
+    engine, db_path, df_countries, queries = standin
+    repository = CountryRepository(engine, df_countries, ttl=0)
+    old_value = repository.get_disease_stats(1)['diabetes']
+
+    execute(db_path, 'DROP TABLE disease_statistics')
+    assert repository.get_disease_stats(1)['diabetes'] == old_value
+    wait_for_refresh(repository)
+    assert repository.get_disease_stats(1)['diabetes'] == old_value
+
+
+def test_duplicate_rows_are_merged_once(standin):
+    engine, db_path, df_countries, queries = standin
+    execute(db_path, "INSERT INTO countries SELECT * FROM countries WHERE name = 'Country 006'")
+    repository = CountryRepository(engine, df_countries.head(4))
+
+    country = repository.get_country('Country 006')
+    assert isinstance(country, pd.Series)
+    # Повторная догрузка той же страны не дублирует строку справочника
+    repository._add_countries(df_countries[df_countries['name'] == 'Country 006'])
+    countries = repository.get_countries(['Country 006', 'Country 007', 'Country 007'])
+    assert list(countries['name']) == ['Country 006', 'Country 007']
+    assert repository.country_id('Country 006') == country['id']
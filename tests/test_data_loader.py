@@ -0,0 +1,70 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+from data_loader import create_db_engine, load_prepared_datasets, load_risks
+from standin import build_standin
+
+
+def write_risks(path, lines):
+    path.write_text('\n'.join(lines) + '\n', encoding='cp1251')
+    return str(path)
+
+
+def test_risks_are_parsed_and_indexed(tmp_path):
+    path = write_risks(tmp_path / 'risks.csv', [
+        'ID страны; Риск общий; Риск по возрасту; Высокий риск госпитализации; Регион Север',
+        '2; 0,25; 0,1; 0,05; 12,5',
+        '1; 0,3; 0,2; 0,01; 340',
+    ])
+    risk_df = load_risks(path)
+
+    assert list(risk_df.index) == [1, 2]
+    assert risk_df['Риск общий'].dtype == 'float32'
+    np.testing.assert_allclose(risk_df.loc[2, 'Риск общий'], 0.25)
+    # Колонка без объявленного диапазона не обязана быть долей
+    np.testing.assert_allclose(risk_df['Регион Север'], [340, 12.5])
+
+
+def test_bad_rows_are_dropped(tmp_path, caplog):
+    path = write_risks(tmp_path / 'risks.csv', [
+        'ID страны; Риск общий; Риск по возрасту; Высокий риск госпитализации',
+        '1; 0,3; 0,2; 0,01',
+        '2; 1,5; 0,1; 0,05',
+        '3; 0,2; н/д; 0,02',
+    ])
+    with caplog.at_level(logging.WARNING, logger='data_loader'):
+        risk_df = load_risks(path)
+
+    assert list(risk_df.index) == [1]
+    assert 'отброшено строк с ошибками: 2 из 3' in caplog.text
+
+
+def test_prepared_datasets_are_cached(tmp_path, monkeypatch):
+    env = build_standin(str(tmp_path), n_countries=6, n_days=12)
+    materials_dir = env['COVID_MATERIALS_DIR']
+    cache_dir = os.path.join(materials_dir, '.cache')
+    engine = create_db_engine(env['COVID_DB_URL'])
+    prepared = []
+    prepare_datasets = data_loader.prepare_datasets
+    monkeypatch.setattr(data_loader, 'prepare_datasets', lambda datasets: prepared.append(1) or prepare_datasets(datasets))
+
+    first = load_prepared_datasets(engine, materials_dir, cache_dir)
+    second = load_prepared_datasets(engine, materials_dir, cache_dir)
+    assert len(prepared) == 1
+    assert list(second) == list(first)
+    pd.testing.assert_frame_equal(second['daily_stats_df'], first['daily_stats_df'])
+    pd.testing.assert_frame_equal(second['map_table'], first['map_table'])
+    np.testing.assert_array_equal(second['range_index.sums.confirmed_per_100k'],
+                                  first['range_index.sums.confirmed_per_100k'])
+
+    # Измененный исходный файл дает другой отпечаток: наборы готовятся заново
+    with open(os.path.join(materials_dir, 'risks.csv'), 'a', encoding='cp1251') as f:
+        f.write('999;0,5;0,5;0,5\n')
+    third = load_prepared_datasets(engine, materials_dir, cache_dir)
+    assert len(prepared) == 2
+    assert third['fingerprint'][0] != first['fingerprint'][0]
+    engine.dispose()
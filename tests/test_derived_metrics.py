@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from country_store import CountryStore
+from derived_metrics import LOOKBACK_DAYS, add_derived_metrics
+from schema import DAY_COLUMN, compact_daily_stats
+from standin import make_datasets
+
+
+@pytest.fixture
+def daily():
+    daily = compact_daily_stats(make_datasets(12, 90, seed=5)['daily'])
+    # Пропуски: отдельные дни стран и пустые значения
+    rng = np.random.default_rng(1)
+    daily = daily[rng.random(len(daily)) > 0.05].reset_index(drop=True)
+    daily.loc[rng.random(len(daily)) < 0.03, 'confirmed_per_100k'] = np.nan
+    return daily
+
+
+@pytest.mark.parametrize('split_day', [30, 75, 89])
+def test_incremental_matches_full(daily, split_day):
+    split = int(daily[DAY_COLUMN].min()) + split_day
+    full = add_derived_metrics(daily)
+
+    base = add_derived_metrics(daily[daily[DAY_COLUMN] < split])
+    delta = daily[daily[DAY_COLUMN] >= split]
+    history = CountryStore(base).tails(delta['name'].astype(str).unique(), LOOKBACK_DAYS)
+    incremental = add_derived_metrics(delta, history)
+
+    expected = full[full[DAY_COLUMN] >= split]
+    key = ['name', DAY_COLUMN]
+    expected = expected.assign(name=expected['name'].astype(str)).sort_values(key).reset_index(drop=True)
+    incremental = incremental.assign(name=incremental['name'].astype(str)).sort_values(key).reset_index(drop=True)
+
+    # Итог из истории попадает в кадр раньше остальных колонок: порядок колонок не сравниваем
+    assert sorted(incremental.columns) == sorted(expected.columns)
+    pd.testing.assert_frame_equal(incremental[expected.columns], expected, check_exact=False, rtol=1e-4)
@@ -0,0 +1,37 @@
+import pandas as pd
+
+from country_store import CountryStore
+from derived_metrics import LOOKBACK_DAYS, add_derived_metrics
+from ingest import prepare_delta
+from schema import DAY_COLUMN, compact_daily_stats
+
+
+def raw_rows(rows):
+    return pd.DataFrame(rows, columns=['name', 'observed_date', 'confirmed_per_100k', 'deaths_per_100k']).assign(
+        observed_date=lambda df: pd.to_datetime(df['observed_date']))
+
+
+def test_late_rows_for_last_day_are_kept():
+    loaded = add_derived_metrics(compact_daily_stats(raw_rows([
+        ('A', '2020-03-01', 1.0, 0.1), ('A', '2020-03-02', 2.0, 0.2),
+        ('B', '2020-03-01', 3.0, 0.3),
+    ])))
+    store = CountryStore(loaded)
+    max_day = int(loaded[DAY_COLUMN].max())
+
+    delta = prepare_delta([raw_rows([
+        ('A', '2020-02-29', 9.0, 0.9),  # старше последнего дня
+        ('A', '2020-03-02', 2.0, 0.2),  # уже загружена
+        ('B', '2020-03-02', 4.0, 0.4),  # страна прислала последний день позже
+        ('B', '2020-03-03', 5.0, 0.5),
+    ])], loaded, max_day, get_history=lambda names: store.tails(names, LOOKBACK_DAYS))
+
+    assert list(zip(delta['name'].astype(str), delta[DAY_COLUMN] - max_day)) == [('B', 0), ('B', 1)]
+    assert delta['confirmed_per_100k_cumulative'].tolist() == [7.0, 12.0]
+
+
+def test_last_day_rows_without_history_are_dropped():
+    loaded = compact_daily_stats(raw_rows([('A', '2020-03-01', 1.0, 0.1)]))
+    delta = prepare_delta([raw_rows([('B', '2020-03-01', 2.0, 0.2), ('B', '2020-03-02', 3.0, 0.3)])],
+                          loaded, int(loaded[DAY_COLUMN].max()))
+    assert len(delta) == 1
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from map_index import MAP_COLUMNS, build_date_index, build_map_countries, generate_country_colors
+from schema import DAY_COLUMN, compact_coords, compact_daily_stats, day_to_timestamp
+from standin import make_datasets
+
+
+def test_frames_match_merge():
+    datasets = make_datasets(8, 20, seed=4)
+    daily = compact_daily_stats(datasets['daily'])
+    coord_df = compact_coords(datasets['coord'])
+    # Страна без координат на карту не попадает
+    coord_df.loc[3, 'longitude'] = np.nan
+    colors = generate_country_colors(coord_df['name'].tolist())
+    date_index = build_date_index(daily, build_map_countries(coord_df, colors))
+
+    day = int(daily[DAY_COLUMN].min()) + 5
+    expected = pd.merge(daily[daily[DAY_COLUMN] == day], coord_df, on='name').dropna(subset=['longitude'])
+    frame = date_index[day_to_timestamp(day)]
+
+    assert list(frame.columns) == MAP_COLUMNS
+    assert list(frame['name']) == list(expected['name'].astype(str))
+    np.testing.assert_array_equal(frame['longitude'], expected['longitude'])
+    np.testing.assert_array_equal(frame['confirmed_per_100k'], expected['confirmed_per_100k'])
+    assert list(frame['country_color']) == [colors[name] for name in frame['name']]
+    np.testing.assert_array_equal(frame['marker_size'], np.clip(expected['confirmed_per_100k'] + 1, 5, 50))
+
+
+def test_extended_matches_rebuild():
+    datasets = make_datasets(6, 30, seed=2)
+    daily = compact_daily_stats(datasets['daily'])
+    coord_df = compact_coords(datasets['coord'])
+    countries = build_map_countries(coord_df, generate_country_colors(coord_df['name'].tolist()))
+    split = int(daily[DAY_COLUMN].min()) + 20
+
+    base = build_date_index(daily[daily[DAY_COLUMN] < split], countries)
+    extended = base.extended(build_date_index(daily[daily[DAY_COLUMN] >= split], countries))
+    rebuilt = build_date_index(daily, countries)
+
+    assert len(base) == 20
+    assert list(extended) == list(rebuilt)
+    for date in rebuilt:
+        pd.testing.assert_frame_equal(extended[date], rebuilt[date])
+
+
+def test_late_rows_join_their_date():
+    datasets = make_datasets(6, 10, seed=3)
+    daily = compact_daily_stats(datasets['daily'])
+    coord_df = compact_coords(datasets['coord'])
+    countries = build_map_countries(coord_df, generate_country_colors(coord_df['name'].tolist()))
+    last_day = int(daily[DAY_COLUMN].max())
+    late = (daily[DAY_COLUMN] == last_day) & daily['name'].astype(str).isin(['Country 002', 'Country 005'])
+
+    base = build_date_index(daily[~late], countries)
+    extended = base.extended(build_date_index(daily[late], countries))
+    date = day_to_timestamp(last_day)
+
+    assert len(base[date]) == 4
+    frame = extended[date].sort_values('name').reset_index(drop=True)
+    pd.testing.assert_frame_equal(frame, build_date_index(daily, countries)[date])
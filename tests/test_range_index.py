@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from map_index import generate_country_colors
+from range_index import RANGE_METRICS, RangeIndex
+from schema import DAY_COLUMN, compact_coords, compact_daily_stats, day_to_timestamp
+from standin import make_datasets
+
+
+@pytest.fixture
+def data():
+    datasets = make_datasets(10, 60, seed=3)
+    daily = compact_daily_stats(datasets['daily'])
+    # Пропуски: отдельные дни стран и пустые значения
+    rng = np.random.default_rng(2)
+    daily = daily[rng.random(len(daily)) > 0.1].reset_index(drop=True)
+    daily.loc[rng.random(len(daily)) < 0.05, 'confirmed_per_100k'] = np.nan
+    coord_df = compact_coords(datasets['coord'])
+    return daily, coord_df, generate_country_colors(daily['name'].astype(str).unique())
+
+
+def by_name(df):
+    return df.sort_values('name').reset_index(drop=True)
+
+
+def test_extended_matches_rebuild(data):
+    daily, coord_df, colors = data
+    first_day = int(daily[DAY_COLUMN].min())
+    last_day = int(daily[DAY_COLUMN].max())
+    splits = [first_day + 20, first_day + 21, first_day + 40, last_day + 1]
+
+    index = RangeIndex(daily[daily[DAY_COLUMN] < splits[0]], coord_df, colors)
+    branch_from = index
+    for start, stop in zip(splits, splits[1:]):
+        index = index.extended(daily[(daily[DAY_COLUMN] >= start) & (daily[DAY_COLUMN] < stop)])
+    # Ветка от старого индекса не должна портить уже продолженный
+    branch = branch_from.extended(daily[(daily[DAY_COLUMN] >= splits[0]) & (daily[DAY_COLUMN] < splits[2])])
+    rebuilt = RangeIndex(daily, coord_df, colors)
+    rebuilt_branch = RangeIndex(daily[daily[DAY_COLUMN] < splits[2]], coord_df, colors)
+
+    assert index.n_days == rebuilt.n_days
+    for start, end in [(first_day, last_day), (first_day + 5, first_day + 33), (last_day - 3, last_day)]:
+        for aggregation in ('sum', 'mean', 'max'):
+            args = day_to_timestamp(start), day_to_timestamp(end), aggregation
+            pd.testing.assert_frame_equal(by_name(index.query(*args)), by_name(rebuilt.query(*args)))
+            pd.testing.assert_frame_equal(by_name(branch.query(*args)), by_name(rebuilt_branch.query(*args)))
+
+
+@pytest.mark.parametrize('aggregation', ['sum', 'mean', 'max'])
+def test_query_matches_groupby(data, aggregation):
+    daily, coord_df, colors = data
+    index = RangeIndex(daily, coord_df, colors)
+    first_day = int(daily[DAY_COLUMN].min())
+
+    for start, end in [(first_day, first_day + 59), (first_day + 7, first_day + 19), (first_day + 30, first_day + 30)]:
+        rows = daily[(daily[DAY_COLUMN] >= start) & (daily[DAY_COLUMN] <= end)]
+        rows = rows.assign(name=rows['name'].astype(str))
+        grouped = rows.groupby('name')[RANGE_METRICS]
+        if aggregation == 'sum':
+            expected = grouped.sum(min_count=1)
+        else:
+            expected = grouped.agg(aggregation)
+        # Страны без данных за период в кадр не попадают
+        expected = expected[expected.notna().any(axis=1)].reset_index()
+
+        result = by_name(index.query(day_to_timestamp(start), day_to_timestamp(end), aggregation))
+        assert list(result['name']) == list(expected['name'])
+        for metric in RANGE_METRICS:
+            np.testing.assert_allclose(result[metric].to_numpy(dtype='float64'),
+                                       expected[metric].to_numpy(dtype='float64'), rtol=1e-5)
+
+
+def test_late_rows_for_last_day(data):
+    daily, coord_df, colors = data
+    split = int(daily[DAY_COLUMN].min()) + 30
+    names = daily['name'].astype(str)
+    # Часть стран прислала последний день позже остальных
+    late = (daily[DAY_COLUMN] == split - 1) & names.isin(['Country 001', 'Country 004', 'Country 007'])
+
+    old = RangeIndex(daily[(daily[DAY_COLUMN] < split) & ~late], coord_df, colors)
+    before = {aggregation: old.query(day_to_timestamp(split - 10), day_to_timestamp(split - 1), aggregation)
+              for aggregation in ('sum', 'mean', 'max')}
+    index = old.extended(daily[late])
+    index = index.extended(daily[(daily[DAY_COLUMN] >= split) & (daily[DAY_COLUMN] < split + 5)])
+    rebuilt = RangeIndex(daily[daily[DAY_COLUMN] < split + 5], coord_df, colors)
+
+    for start, end in [(split - 10, split - 1), (split - 1, split - 1), (split - 20, split + 4)]:
+        for aggregation in ('sum', 'mean', 'max'):
+            args = day_to_timestamp(start), day_to_timestamp(end), aggregation
+            pd.testing.assert_frame_equal(by_name(index.query(*args)), by_name(rebuilt.query(*args)))
+    # Старый индекс продолжает видеть свои данные
+    for aggregation, frame in before.items():
+        pd.testing.assert_frame_equal(
+            old.query(day_to_timestamp(split - 10), day_to_timestamp(split - 1), aggregation), frame)
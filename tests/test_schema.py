@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from schema import compact_countries, compact_daily_stats
+
+
+def test_large_whole_numbers_stay_exact():
+    df = pd.DataFrame({
+        'id': [1, 2],
+        'name': ['A', 'B'],
+        'population': [146_171_015.0, 1_411_750_001.0],
+        'cases': [16_777_217.0, np.nan],
+        'beds': [120.0, np.nan],
+        'density': [8.4, 153.7],
+    })
+    compact = compact_countries(df)
+
+    assert compact['population'].tolist() == df['population'].tolist()
+    # Счетчик больше 2^24 не переживает float32 и остается float64
+    assert compact['cases'].dtype == 'float64'
+    assert compact['cases'].iloc[0] == 16_777_217
+    assert compact['beds'].dtype == 'float32'
+    assert compact['density'].dtype == 'float32'
+
+
+def test_daily_metrics_are_float32():
+    daily = compact_daily_stats(pd.DataFrame({
+        'name': ['A', 'A'],
+        'observed_date': pd.to_datetime(['2020-03-01', '2020-03-02']),
+        'confirmed_per_100k': [1.25, 3.5],
+        'deaths_per_100k': [0.1, np.nan],
+    }))
+    assert daily['confirmed_per_100k'].dtype == 'float32'
+    assert daily['deaths_per_100k'].dtype == 'float32'